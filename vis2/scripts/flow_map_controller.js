@@ -1,8 +1,22 @@
 // Flow Map Controller: Handles dynamic country highlighting based on trade value slider
 
 var flowMapView = null;
-var exportsData = null;
-var importsData = null;
+// Per flowType and year: countries sorted by trade value (largest first), built by build_pipeline.py
+var flowIndex = null;
+// Lon/lat grid of candidate country polygons for hover hit-testing, built by build_pipeline.py
+var countryHitGrid = null;
+// Pixel -> lon/lat for the hit test; set when the spec draws pre-projected geometry
+var flowMapInvert = null;
+// Flow file per flowType and year, from build_pipeline.py --shards; without it each flowType loads whole
+var flowShardManifest = null;
+// Whether the spec's flows come from the flows_<flowType> data sources this file fills
+var flowShardsEnabled = false;
+// Decoded flow features by url, least recently used first
+const flowShardCache = new Map();
+const FLOW_SHARD_CACHE_LIMIT = 12;
+const FLOW_TYPES = ['exports', 'imports'];
+var flowShardRequest = 0;
+var flowShardShown = null;
 
 // Country trade descriptions
 const countryTradeDescriptions = {
@@ -76,29 +90,28 @@ const countryTradeDescriptions = {
 	}
 };
 
+// Number of leading entries in a descending array that are >= minValue (binary search)
+function countAtLeast(values, minValue) {
+	let lo = 0;
+	let hi = values.length;
+	while (lo < hi) {
+		const mid = (lo + hi) >>> 1;
+		if (values[mid] >= minValue) {
+			lo = mid + 1;
+		} else {
+			hi = mid;
+		}
+	}
+	return lo;
+}
+
 // Function to get qualifying countries based on current parameters
 function getQualifyingCountries(year, flowType, minValue) {
-	const data = flowType === 'exports' ? exportsData : importsData;
-	const countries = new Set();
-	
-	// Group by country and get max value for each (since data has multiple segments)
-	const countryValues = {};
-	data.forEach(d => {
-		if (d.year === year) {
-			if (!countryValues[d.country] || countryValues[d.country] < d.value) {
-				countryValues[d.country] = d.value;
-			}
-		}
-	});
+	const entry = flowIndex && flowIndex[flowType] && flowIndex[flowType][year];
+	if (!entry) return new Set();
 	
-	// Add countries that meet the threshold
-	Object.keys(countryValues).forEach(country => {
-		if (countryValues[country] >= minValue) {
-			countries.add(country);
-		}
-	});
-	
-	return countries;
+	// Countries are sorted by value, so those meeting the threshold are a prefix
+	return new Set(entry.countries.slice(0, countAtLeast(entry.values, minValue)));
 }
 
 // Update country highlighting based on current parameter values
@@ -116,25 +129,92 @@ function updateCountryHighlighting() {
 	flowMapView.runAsync();
 }
 
+// Url of the flow features for one flowType and year: its shard, or the whole flow file without a manifest
+function flowShardUrl(flowType, year) {
+	if (!flowShardManifest) return `data/flow_features_${flowType}.topojson`;
+	const shards = flowShardManifest.shards[flowType];
+	return shards && shards[year] ? shards[year].url : null;
+}
+
+// Fetch and decode a shard once; later requests reuse it until it falls out of the cache
+function loadFlowShard(url) {
+	if (!url) return Promise.resolve([]);
+	let features = flowShardCache.get(url);
+	if (features) {
+		flowShardCache.delete(url);
+	} else {
+		const format = flowShardManifest ? flowShardManifest.format : {type: 'topojson', feature: 'flows'};
+		features = fetch(url).then(function(r) {
+			if (!r.ok) throw new Error(url + ': HTTP ' + r.status);
+			return r.text();
+		}).then(text => vega.read(text, format));
+		// Forget a failed fetch so the next request retries it
+		features.catch(() => flowShardCache.delete(url));
+	}
+	flowShardCache.set(url, features);
+	if (flowShardCache.size > FLOW_SHARD_CACHE_LIMIT) {
+		flowShardCache.delete(flowShardCache.keys().next().value);
+	}
+	return features;
+}
+
+function hasDataSource(view, name) {
+	try {
+		view.data(name);
+		return true;
+	} catch (e) {
+		return false;
+	}
+}
+
+// Fill the flow data sources with the features of the visible flowType and year only
+function showFlowShard() {
+	if (!flowMapView || !flowShardsEnabled) return Promise.resolve();
+	const flowType = flowMapView.signal('flowType');
+	const url = flowShardUrl(flowType, flowMapView.signal('selectedYear'));
+	const shown = flowType + ' ' + url;
+	// Taken before the early return, so a load still in flight for another selection is dropped
+	const request = ++flowShardRequest;
+	if (shown === flowShardShown) return Promise.resolve();
+	return loadFlowShard(url).then(function(features) {
+		// A later selection has taken over
+		if (request !== flowShardRequest) return;
+		for (const type of FLOW_TYPES) {
+			flowMapView.change('flows_' + type, vega.changeset().remove(vega.truthy).insert(type === flowType ? features : []));
+		}
+		flowShardShown = shown;
+		return flowMapView.runAsync();
+	});
+}
+
 // Initialize flow map with dynamic country highlighting
 function initializeFlowMap(spec) {
-	// Load trade data for dynamic country filtering
+	// Load the country/value index for dynamic country filtering
 	return Promise.all([
-		fetch('data/NEW_flow_lines_exports.json').then(r => r.json()),
-		fetch('data/NEW_flow_lines_imports.json').then(r => r.json()),
+		fetch('data/flow_index.json').then(r => r.json()),
+		// Without the grid, hover falls back to Vega's own picking
+		fetch('data/country_hit_grid.json').then(r => r.json()).catch(() => null),
+		fetch('data/flow_shards/manifest.json').then(r => r.json()).catch(() => null),
 		vegaEmbed('#flow_map', spec, {"actions": false})
-	]).then(function([exports, imports, result]) {
+	]).then(function([index, grid, manifest, result]) {
 		flowMapView = result.view;
-		exportsData = exports;
-		importsData = imports;
+		flowIndex = index;
+		countryHitGrid = grid ? decodeHitGrid(grid) : null;
+		flowShardManifest = manifest;
+		flowShardsEnabled = FLOW_TYPES.every(type => hasDataSource(flowMapView, 'flows_' + type));
+		// flow_map_projected.vg.json draws pixels through an identity projection and records the real fit
+		const usermeta = result.spec && result.spec.usermeta;
+		flowMapInvert = usermeta && usermeta.equalEarth ? equalEarthInvert(usermeta.equalEarth) : null;
 
 		// Listen for parameter changes and update country highlighting
 		flowMapView.addSignalListener('selectedYear', function(name, value) {
 			updateCountryHighlighting();
+			showFlowShard().catch(console.error);
 		});
 		
 		flowMapView.addSignalListener('flowType', function(name, value) {
 			updateCountryHighlighting();
+			showFlowShard().catch(console.error);
 		});
 		
 		flowMapView.addSignalListener('minTradeValue', function(name, value) {
@@ -147,10 +227,90 @@ function initializeFlowMap(spec) {
 		// Setup country hover tooltips
 		setupCountryHoverTooltips(flowMapView);
 		
-		return result;
+		// First paint needs only the visible flowType and year
+		return showFlowShard().then(() => result);
 	});
 }
 
+// Unpack the delta-encoded rings and the flat [cell delta, count, polygons...] cell list
+function decodeHitGrid(grid) {
+	const cells = new Map();
+	let cell = 0;
+	for (let i = 0; i < grid.cells.length; i += 2 + grid.cells[i + 1]) {
+		cell += grid.cells[i];
+		cells.set(cell, grid.cells.slice(i + 2, i + 2 + grid.cells[i + 1]));
+	}
+	const polygons = grid.polygons.map(function(polygon) {
+		return {
+			country: grid.names[polygon.country],
+			rings: polygon.rings.map(function(deltas) {
+				const ring = new Float64Array(deltas.length);
+				let x = 0;
+				let y = 0;
+				for (let j = 0; j < deltas.length; j += 2) {
+					x += deltas[j];
+					y += deltas[j + 1];
+					ring[j] = x / grid.scale;
+					ring[j + 1] = y / grid.scale;
+				}
+				return ring;
+			})
+		};
+	});
+	return {x0: grid.bbox[0], y0: grid.bbox[1], cellSize: grid.cellSize, cols: grid.cols, rows: grid.rows, cells, polygons};
+}
+
+// Even-odd ray casting over all rings of a polygon, so holes count as outside
+function pointInRings(lon, lat, rings) {
+	let inside = false;
+	for (const ring of rings) {
+		const n = ring.length / 2;
+		for (let i = 0, j = n - 1; i < n; j = i++) {
+			const xi = ring[2 * i], yi = ring[2 * i + 1];
+			const xj = ring[2 * j], yj = ring[2 * j + 1];
+			if ((yi > lat) !== (yj > lat) && lon < xi + (lat - yi) * (xj - xi) / (yj - yi)) {
+				inside = !inside;
+			}
+		}
+	}
+	return inside;
+}
+
+// Country under a lon/lat position: one cell lookup, then point-in-polygon on its few candidates
+function countryAt(grid, lon, lat) {
+	const col = Math.floor((lon - grid.x0) / grid.cellSize);
+	const row = Math.floor((lat - grid.y0) / grid.cellSize);
+	if (col < 0 || col >= grid.cols || row < 0 || row >= grid.rows) return null;
+	const candidates = grid.cells.get(row * grid.cols + col);
+	if (!candidates) return null;
+	for (const poly of candidates) {
+		// ~i marks a cell lying wholly inside polygon i
+		if (poly < 0) return grid.polygons[~poly].country;
+		if (pointInRings(lon, lat, grid.polygons[poly].rings)) return grid.polygons[poly].country;
+	}
+	return null;
+}
+
+// Inverse of the fitted equalEarth projection, solving its latitude polynomial by Newton's method like d3
+function equalEarthInvert(fit) {
+	const A1 = 1.340264, A2 = -0.081106, A3 = 0.000893, A4 = 0.003796, M = Math.sqrt(3) / 2;
+	return function(xy) {
+		const x = (xy[0] - fit.translate[0]) / fit.scale;
+		const y = (fit.translate[1] - xy[1]) / fit.scale;
+		let l = y, l2 = l * l, l6 = l2 * l2 * l2;
+		for (let i = 0; i < 12; i++) {
+			const delta = (l * (A1 + A2 * l2 + l6 * (A3 + A4 * l2)) - y) / (A1 + 3 * A2 * l2 + l6 * (7 * A3 + 9 * A4 * l2));
+			l -= delta;
+			l2 = l * l;
+			l6 = l2 * l2 * l2;
+			if (Math.abs(delta) < 1e-12) break;
+		}
+		const lon = M * x * (A1 + 3 * A2 * l2 + l6 * (7 * A3 + 9 * A4 * l2)) / Math.cos(l);
+		const lat = Math.asin(Math.sin(l) / M);
+		return Math.abs(lon) <= Math.PI ? [lon * 180 / Math.PI, lat * 180 / Math.PI] : null;
+	};
+}
+
 // Setup hover tooltips for countries on the flow map
 function setupCountryHoverTooltips(view) {
 	// Create tooltip element if it doesn't exist
@@ -163,43 +323,72 @@ function setupCountryHoverTooltips(view) {
 		document.body.appendChild(tooltip);
 	}
 	
+	function showCountryTooltip(countryName, event) {
+		// Don't show tooltip for Australia
+		if (!countryName || countryName === 'Australia') {
+			tooltip.style.display = 'none';
+			return;
+		}
+		
+		// Map country names to match our descriptions
+		const countryNameMap = {
+			'United States of America': 'United States',
+			'United Arab Emirates': 'United Arab Emirates'
+		};
+		
+		const lookupName = countryNameMap[countryName] || countryName;
+		const countryInfo = countryTradeDescriptions[lookupName];
+		
+		if (countryInfo) {
+			const displayName = lookupName;
+			const html = `
+				<strong>${displayName}</strong><br><br>
+				<strong><span style="color: #ff9500;">Exports</span> to ${displayName}:</strong><br>
+				${countryInfo.exports}<br><br>
+				<strong><span style="color: #3498db;">Imports</span> from ${displayName}:</strong><br>
+				${countryInfo.imports}
+			`;
+			tooltip.innerHTML = html;
+			tooltip.style.display = 'block';
+			
+			// Position tooltip at bottom-left relative to cursor
+			const tooltipWidth = 400; // max-width from CSS
+			const tooltipHeight = 200; // approximate
+			tooltip.style.left = (event.clientX - tooltipWidth - 10) + 'px';
+			tooltip.style.top = (event.clientY + 10) + 'px';
+		} else {
+			tooltip.style.display = 'none';
+		}
+	}
+	
+	let invert = flowMapInvert;
+	if (!invert) {
+		try {
+			const projection = view.scale('projection');
+			invert = projection && projection.invert;
+		} catch (e) {
+			invert = null;
+		}
+	}
+	
+	if (countryHitGrid && invert) {
+		// Resolve the country from the cursor position instead of picking against the map polygons
+		view.addEventListener('mousemove', function(event) {
+			const lonLat = event.vega ? invert(event.vega.xy()) : null;
+			const country = lonLat && isFinite(lonLat[0]) && isFinite(lonLat[1])
+				? countryAt(countryHitGrid, lonLat[0], lonLat[1])
+				: null;
+			showCountryTooltip(country, event);
+		});
+		view.container().addEventListener('mouseleave', function() {
+			tooltip.style.display = 'none';
+		});
+		return;
+	}
+	
 	view.addEventListener('mouseover', function(event, item) {
 		if (item && item.datum && item.datum.properties && item.datum.properties.NAME) {
-			let countryName = item.datum.properties.NAME;
-			
-			// Don't show tooltip for Australia
-			if (countryName === 'Australia') {
-				tooltip.style.display = 'none';
-				return;
-			}
-			
-			// Map country names to match our descriptions
-			const countryNameMap = {
-				'United States of America': 'United States',
-				'United Arab Emirates': 'United Arab Emirates'
-			};
-			
-			const lookupName = countryNameMap[countryName] || countryName;
-			const countryInfo = countryTradeDescriptions[lookupName];
-			
-			if (countryInfo) {
-				const displayName = lookupName;
-				const html = `
-					<strong>${displayName}</strong><br><br>
-					<strong><span style="color: #ff9500;">Exports</span> to ${displayName}:</strong><br>
-					${countryInfo.exports}<br><br>
-					<strong><span style="color: #3498db;">Imports</span> from ${displayName}:</strong><br>
-					${countryInfo.imports}
-				`;
-				tooltip.innerHTML = html;
-				tooltip.style.display = 'block';
-				
-				// Position tooltip at bottom-left relative to cursor
-				const tooltipWidth = 400; // max-width from CSS
-				const tooltipHeight = 200; // approximate
-				tooltip.style.left = (event.clientX - tooltipWidth - 10) + 'px';
-				tooltip.style.top = (event.clientY + 10) + 'px';
-			}
+			showCountryTooltip(item.datum.properties.NAME, event);
 		}
 	});
 	
@@ -0,0 +1,31 @@
+"""Ingestion of ABS tables whose periods are not half years."""
+import pytest
+
+from trade_pipeline.convert_csv_to_json import extract_from_csv, ingest_csv
+from trade_pipeline.trade_cube import build_cube
+
+MONTHLY_TABLE = '''Australian Bureau of Statistics,,,
+,Free on Board (FOB) Value (a),,
+,($m),,
+Country of Final Destination,January 2020,February 2020,March 2020
+China,2000,np,1500
+Japan,900,800,
+Total (b),2900,800,1500
+'''
+
+@pytest.fixture
+def monthly_table(tmp_path):
+    path = tmp_path / 'monthly.csv'
+    path.write_text(MONTHLY_TABLE, encoding='utf-8')
+    return str(path)
+
+def test_monthly_table_rolls_up_by_year(monthly_table):
+    totals = sorted(ingest_csv(monthly_table, 'exports'), key=lambda r: r['country'])
+    assert totals == [{'country': 'China', 'year': 2020, 'value': 3500.0},
+                      {'country': 'Japan', 'year': 2020, 'value': 1700.0}]
+    # Below the $5B cutoff, so nothing is kept, but nothing raises either
+    assert extract_from_csv(monthly_table, 'exports') == []
+
+def test_trade_cube_needs_half_years(monthly_table):
+    with pytest.raises(ValueError, match='six-month'):
+        build_cube({'exports': monthly_table})
@@ -0,0 +1,47 @@
+"""Data pipeline of the trade flow map.
+
+Each step is a plain function of records and arrays:
+
+    ingest       ABS six-month table (.xlsx or .csv) -> country-year totals in $M
+    aggregate    totals -> $B records passing the map filters
+    build_flows  records -> straight flow lines between country centroids
+    curve        flow lines -> sampled great-circle arcs
+    clip         arcs -> runs inside the map bbox
+    write        flow lines and runs -> segments, GeoJSON or TopoJSON file
+
+build_cube ingests the tables into a country x half-year x direction
+TradeCube, and load_cube memory-maps a saved one for slices, rollups, top-k
+and threshold queries (see trade_cube).
+
+convert and build run the whole job (see build_pipeline). Steps are imported
+on first use, so importing the package loads neither pandas nor NumPy. The
+command line entry point is python -m trade_pipeline (see cli).
+"""
+import importlib
+
+# Public name -> (module, function)
+_API = {
+    'ingest': ('convert_csv_to_json', 'ingest_csv'),
+    'aggregate': ('convert_csv_to_json', 'aggregate_trade'),
+    'build_flows': ('convert_csv_to_json', 'create_flow_lines'),
+    'curve': ('make_curved_flows_clip_topo', 'flow_arcs'),
+    'clip': ('make_curved_flows_clip_topo', 'clip_arcs'),
+    'write': ('make_curved_flows_clip_topo', 'write_flow_runs'),
+    'build_cube': ('trade_cube', 'build_cube'),
+    'load_cube': ('trade_cube', 'load_cube'),
+    'convert': ('convert_csv_to_json', 'main'),
+    'build': ('build_pipeline', 'main'),
+}
+
+__all__ = list(_API)
+
+def __getattr__(name):
+    if name not in _API:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    module, attr = _API[name]
+    value = getattr(importlib.import_module(f'.{module}', __name__), attr)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted({*globals(), *_API})
@@ -0,0 +1,104 @@
+"""Pre-aggregate the goods stacked-area datasets.
+
+Reads the monthly ABS goods workbooks (or their LONG CSV exports) once, drops
+the subtotal rows, remaps each Item to its chart category from GOODS_DATASETS
+and writes one row per (Date, category) with the category's mean as avg_value
+(used for stack order). The stacked-area specs load these files directly,
+without transforms. Run from the vis2 directory:
+
+    python -m trade_pipeline goods
+"""
+import logging
+
+from .excel_ingest import DEFAULT_SHEET_CACHE_DIR, time_series_long
+
+log = logging.getLogger(__name__)
+
+MIN_YEAR = 2010
+
+# 'breakdown' is the first and last workbook series of the general merchandise
+# breakdown, the block the LONG CSVs were exported from. Category rules are
+# tried in order; the first match wins. ('equals', item) and ('contains', text)
+# test the raw Item; unmatched items fall back to 'default' (None keeps the Item).
+GOODS_DATASETS = {
+    'exports': {
+        'source': 'data/excel files/TABLE 3. GOODS CREDITS, Original, Current prices.xlsx',
+        'output': 'data/goods_exports_by_category.csv',
+        'breakdown': ('Rural goods', 'Other non-rural (incl. sugar and beverages)'),
+        'exclude': ['Rural goods', 'Non-rural goods', 'Other non-rural (incl. sugar and beverages)'],
+        'absolute': False,
+        'rules': [
+            ('equals', 'Cereal grains and cereal preparations', 'Cereal grains'),
+            ('equals', 'Wool and sheepskins', 'Other rural'),
+            ('equals', 'Transport equipment', 'Manufacturing'),
+            ('equals', 'Machinery', 'Manufacturing'),
+            ('equals', 'Other manufactures', 'Manufacturing'),
+        ],
+        'default': None,
+    },
+    'imports': {
+        'source': 'data/excel files/TABLE 4. GOODS DEBITS, Original, Current prices.xlsx',
+        'output': 'data/goods_imports_by_category.csv',
+        'breakdown': ('Consumption goods', 'Other merchandise goods'),
+        'exclude': ['Consumption goods', 'Capital goods', 'Intermediate and other merchandise goods'],
+        # Debits are recorded as negative values
+        'absolute': True,
+        'rules': [
+            ('contains', 'Food and beverages', 'Food and beverages'),
+            ('contains', 'Textile', 'Textiles, clothing and footwear'),
+            ('equals', 'Processed industrial supplies n.e.s.', 'Processed industrial supplies'),
+            ('equals', 'Non-industrial transport equipment', 'Non-industrial transport equipment'),
+            ('equals', 'Machinery and industrial equipment', 'Machinery and industrial equipment'),
+            ('equals', 'Fuels and lubricants', 'Fuels and lubricants'),
+            ('contains', 'Parts for', 'Parts and components'),
+            ('equals', 'ADP equipment', 'Computers and data equipment'),
+            ('equals', 'Telecommunications equipment', 'Telecommunications equipment'),
+            ('equals', 'Consumption goods n.e.s.', 'Consumer goods'),
+            ('equals', 'Industrial transport equipment n.e.s.', 'Industrial transport equipment'),
+        ],
+        'default': 'Other',
+    },
+}
+
+def categorize(item, rules, default=None):
+    for kind, pattern, category in rules:
+        if (item == pattern) if kind == 'equals' else (pattern in item):
+            return category
+    return item if default is None else default
+
+def category_table(items, rules, default=None):
+    """{item: category} for the distinct items, so the rules run once per item rather than per row"""
+    return {item: categorize(item, rules, default) for item in items}
+
+def read_goods(path, dataset, cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """Date, Item, Value rows of the general merchandise breakdown"""
+    if not path.lower().endswith('.xlsx'):
+        import pandas as pd
+        return pd.read_csv(path, usecols=['Date', 'Item', 'Value'], dtype={'Date': str, 'Item': str})
+    df = time_series_long(path, cache_dir=cache_dir)
+    # Series are melted column by column, so the breakdown is one contiguous block
+    items = list(dict.fromkeys(df['Item']))
+    first, last = dataset['breakdown']
+    return df[df['Item'].isin(items[items.index(first):items.index(last) + 1])]
+
+def aggregate_goods(path, dataset, min_year=MIN_YEAR, cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """DataFrame of Date, Item (category), Value (summed $M) and avg_value (category mean)"""
+    df = read_goods(path, dataset, cache_dir)
+    df = df[(df['Date'].str[:4].astype(int) >= min_year) & ~df['Item'].isin(dataset['exclude'])]
+    if dataset['absolute']:
+        df = df.assign(Value=df['Value'].abs())
+    categories = category_table(df['Item'].unique(), dataset['rules'], dataset['default'])
+    df = df.assign(Item=df['Item'].map(categories))
+
+    out = df.groupby(['Date', 'Item'], as_index=False)['Value'].sum()
+    out['avg_value'] = out.groupby('Item')['Value'].transform('mean').round(2)
+    return out.sort_values(['Date', 'Item'], ignore_index=True)
+
+def write_goods(out, path):
+    out.to_csv(path, index=False, lineterminator='\n')
+
+def main():
+    for name, dataset in GOODS_DATASETS.items():
+        out = aggregate_goods(dataset['source'], dataset)
+        write_goods(out, dataset['output'])
+        log.info(f"✓ {name}: {len(out)} rows, {out['Item'].nunique()} categories -> {dataset['output']}")
@@ -0,0 +1,70 @@
+import os
+import pickle
+from collections import OrderedDict
+
+CACHE_VERSION = 4
+DEFAULT_CACHE_PATH = '.cache/arc_cache.pkl'
+
+def arc_key(lon1, lat1, lon2, lat2, height, direction, n):
+    """Cache key for one arc: endpoints and curve parameters, rounded so float noise still hits."""
+    return (round(float(lon1), 6), round(float(lat1), 6),
+            round(float(lon2), 6), round(float(lat2), 6),
+            round(float(height), 6), int(direction), n)
+
+class ArcCache:
+    """LRU cache of sampled arc geometry, optionally persisted to disk between runs.
+
+    Entries are (n+1, 2) lon/lat arrays keyed by arc_key(). Once more than
+    max_entries arcs are held, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path=None, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        arc = self.entries.get(key)
+        if arc is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return arc
+
+    def put(self, key, arc):
+        self.entries[key] = arc
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        if data.get('version') != CACHE_VERSION:
+            return
+        for key, arc in data['entries'].items():
+            self.put(key, arc)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'entries': self.entries}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,256 @@
+"""Benchmarks for the flow map data pipeline on synthetic, scalable inputs.
+
+Each case times one stage (or the whole build) on ABS-shaped tables and flow
+sets generated at the chosen scale, and reports wall time (best of --repeat),
+peak Python/NumPy memory (tracemalloc, one extra run) and output size where
+the stage writes a file. Results can be stored as a baseline and later runs
+compared against it. Run from the vis2 directory:
+
+    python -m trade_pipeline benchmark --scale small medium
+    python -m trade_pipeline benchmark --scale small --save-baseline
+    python -m trade_pipeline benchmark --scale small --check
+"""
+import contextlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import build_pipeline
+from .convert_csv_to_json import create_flow_lines, extract_from_csv
+from .make_curved_flows_clip_topo import (FLOW_OUTPUTS, TOPO_PATH, adaptive_arc_points_batch, assign_curve_params,
+                                          clip_arcs, curved_arc_points_batch, flow_bbox, flows_output, topo_bbox,
+                                          write_flows_output)
+from .topojson_index import DEFAULT_INDEX_DIR, build_index, load_topo_index, load_topology, MAP_NAME_MAPPING
+
+log = logging.getLogger(__name__)
+
+BASELINE_PATH = 'benchmarks/baseline.json'
+# partners: rows in the ABS tables; pairs: origin/destination flows; n_points: fixed samples per arc
+SCALES = {
+    'small': {'partners': 50, 'pairs': 300, 'n_points': 24},
+    'medium': {'partners': 500, 'pairs': 2000, 'n_points': 64},
+    'large': {'partners': 5000, 'pairs': 12000, 'n_points': 128},
+}
+# Ratio of current to baseline wall time (or peak memory) reported as a regression
+REGRESSION_RATIO = 1.25
+# ...as long as the wall time also grew by this many seconds; tiny cases are mostly timer noise
+MIN_WALL_DELTA = 0.02
+SEED = 3179
+
+def _period_labels(n_periods, first_year=2013):
+    labels = []
+    for i in range(n_periods):
+        year = first_year + (i + 1) // 2
+        labels.append(f'July {year} to December {year}' if i % 2 == 0 else f'January {year} to June {year}')
+    return labels
+
+def synthetic_abs_table(path, names, n_periods=23, seed=SEED):
+    """Write a six-month ABS table shaped like data/merch_*_raw.csv for the given partner names"""
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.lognormal(7, 1.5, size=(len(names), n_periods))).astype(int)
+    suppressed = rng.random(values.shape) < 0.1
+    width = n_periods + 1
+    rows = [['Australian Bureau of Statistics'], ['Synthetic benchmark table'], [''], [''], [''],
+            ['', 'Free on Board (FOB) Value (a)'], ['', '($m)'],
+            ['Country of Final Destination', *_period_labels(n_periods)]]
+    for name, row, hidden in zip(names, values, suppressed):
+        rows.append([name, *('np' if h else str(v) for v, h in zip(row, hidden))])
+    rows.append(['Total (b)', *(str(v) for v in values.sum(axis=0))])
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for row in rows:
+            cells = [f'"{c}"' if ',' in c else c for c in row]
+            f.write(','.join(cells + [''] * (width - len(cells))) + '\n')
+
+def partner_names(n):
+    """n partner names, real map countries first so the end-to-end build finds coordinates"""
+    countries = sorted(MAP_NAME_MAPPING.get(c, c) for c in load_topo_index(TOPO_PATH)['countries'])
+    countries = [c for c in countries if c != 'Australia']
+    return countries[:n] + [f'Partner {i:05d}' for i in range(max(0, n - len(countries)))]
+
+def synthetic_coords(names, seed=SEED):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-180, 180, len(names))
+    lat = rng.uniform(-60, 75, len(names))
+    coords = {n: {'lat': float(y), 'lon': float(x)} for n, x, y in zip(names, lon, lat)}
+    coords['Australia'] = {'lat': -25.2744, 'lon': 133.7751}
+    return coords
+
+def synthetic_flows(n_pairs, seed=SEED):
+    """Many-to-many flows between random endpoints, spread over 2019-2024"""
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(-180, 180, (n_pairs, 2))
+    lat = rng.uniform(-60, 75, (n_pairs, 2))
+    years = rng.integers(2019, 2025, n_pairs)
+    values = np.round(rng.lognormal(2.5, 1.0, n_pairs), 2)
+    return [{'country': f'Pair {i:05d}', 'year': int(years[i]), 'value': float(values[i]),
+             'origin_lon': float(lon[i, 0]), 'origin_lat': float(lat[i, 0]),
+             'dest_lon': float(lon[i, 1]), 'dest_lat': float(lat[i, 1])}
+            for i in range(n_pairs)]
+
+def _flow_columns(flows):
+    params = assign_curve_params(flows)
+    cols = np.array([[f['origin_lon'], f['origin_lat'], f['dest_lon'], f['dest_lat']] for f in flows]).T
+    heights = np.array([params[i]['height'] for i in range(len(flows))])
+    directions = np.array([params[i]['direction'] for i in range(len(flows))])
+    return (*cols, heights, directions)
+
+@contextlib.contextmanager
+def _quiet():
+    """Drop the pipeline's progress messages and warnings inside the block"""
+    # Warnings too: the end-to-end build's list of partners without coordinates runs to hundreds of names
+    logging.disable(logging.WARNING)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+def measure(fn, repeat=3):
+    """(result, best wall seconds, peak traced bytes); progress messages from fn are dropped"""
+    times = []
+    result = None
+    with _quiet():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        # Tracing slows allocation-heavy code, so memory gets its own run
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return result, min(times), peak
+
+def _output_size(paths):
+    """Total bytes of the output files, None if any is missing"""
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    return sum(os.path.getsize(p) for p in paths)
+
+def benchmark_cases(scale, workdir):
+    """[(name, fn, output paths or None)] for one scale; inputs are generated up front"""
+    cfg = SCALES[scale]
+    names = partner_names(cfg['partners'])
+    table = os.path.join(workdir, 'abs_table.csv')
+    synthetic_abs_table(table, names)
+    with _quiet():
+        trade = extract_from_csv(table, 'exports')
+    coords = synthetic_coords(names)
+    flows = synthetic_flows(cfg['pairs'])
+    cols = _flow_columns(flows)
+    n = cfg['n_points']
+    arcs = curved_arc_points_batch(*cols, n=n)
+    bbox = flow_bbox(TOPO_PATH)
+    runs = clip_arcs(arcs, bbox)
+    topo = load_topology(TOPO_PATH)
+
+    cases = [
+        ('extract_from_csv', lambda: extract_from_csv(table, 'exports'), None),
+        ('create_flow_lines', lambda: create_flow_lines(trade, 'exports', coords), None),
+        (f'curved_arcs_n{n}', lambda: curved_arc_points_batch(*cols, n=n), None),
+        ('adaptive_arcs', lambda: adaptive_arc_points_batch(*cols, tolerance=0.1), None),
+        ('clip_arcs', lambda: clip_arcs(arcs, bbox), None),
+        # Without the index cache, so this times the parse a changed basemap costs
+        ('topo_bbox', lambda: topo_bbox(TOPO_PATH, cache_dir=None), None),
+        ('topo_build_index', lambda: build_index(topo), None),
+    ]
+    for fmt in sorted(FLOW_OUTPUTS):
+        out_path = os.path.join(workdir, f'flows.{fmt}.json')
+        cases.append((f'write_{fmt}',
+                      lambda fmt=fmt, out_path=out_path: write_flows_output(flows_output(flows, runs, fmt), out_path, fmt),
+                      [out_path]))
+    flow_outputs = [os.path.join(workdir, 'vis2', FLOW_OUTPUTS['topojson'].format(t)) for t in build_pipeline.FLOW_SOURCES]
+    cases.append(('end_to_end', lambda: _end_to_end(workdir, names), flow_outputs))
+    return cases
+
+def _end_to_end(workdir, names):
+    """Full forced build_pipeline run in a scratch vis2 layout, synthetic tables as both sources.
+
+    Only partners on the basemap get coordinates, so the flow count stops
+    growing past the ~175 map countries; the synthetic flow cases cover larger sets.
+    """
+    root = os.path.join(workdir, 'vis2')
+    sources = {flow_type: f'data/merch_{flow_type}_raw.csv' for flow_type in build_pipeline.FLOW_SOURCES}
+    if not os.path.exists(root):
+        for path in [TOPO_PATH] + [d['source'] for d in build_pipeline.GOODS_DATASETS.values()]:
+            os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+            shutil.copy(path, os.path.join(root, path))
+        for i, flow_type in enumerate(sources):
+            synthetic_abs_table(os.path.join(root, sources[flow_type]), names, seed=SEED + i)
+    # Every run starts cold, as the first does, so the best of any repeat count compares alike
+    shutil.rmtree(os.path.join(root, DEFAULT_INDEX_DIR), ignore_errors=True)
+    build_pipeline.main(force=True, cache_path=None, sources=sources, root=root)
+
+def run_benchmarks(scales, repeat=3):
+    results = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as workdir:
+            results[scale] = {}
+            for name, fn, out_paths in benchmark_cases(scale, workdir):
+                _, wall, peak = measure(fn, repeat)
+                size = _output_size(out_paths) if out_paths else None
+                results[scale][name] = {'wall_s': round(wall, 5), 'peak_bytes': peak, 'output_bytes': size}
+                log.info(f"  {scale:<7} {name:<20} {wall*1000:10.2f} ms {peak/2**20:9.2f} MiB"
+                         + (f" {size:>11,} B" if size is not None else ''))
+    return results
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_PATH):
+    baseline = load_baseline(path)
+    baseline.update(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(results, baseline, ratio=REGRESSION_RATIO):
+    """Log current/baseline ratios; returns the (scale, case, metric) entries that regressed"""
+    regressions = []
+    for scale, cases in results.items():
+        for name, current in cases.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous:
+                continue
+            changes = []
+            for metric in ('wall_s', 'peak_bytes', 'output_bytes'):
+                before, after = previous.get(metric), current.get(metric)
+                if not before or after is None:
+                    continue
+                r = after / before
+                changes.append(f'{metric} x{r:.2f}')
+                # Output size is deterministic, so any growth counts
+                if metric == 'wall_s' and after - before < MIN_WALL_DELTA:
+                    continue
+                if r > (1.0 if metric == 'output_bytes' else ratio):
+                    regressions.append((scale, name, metric))
+            log.info(f"  {scale:<7} {name:<20} {', '.join(changes)}")
+    return regressions
+
+def main(scales, repeat=3, baseline_path=BASELINE_PATH, save=False, check=False):
+    log.info('Running benchmarks...')
+    results = run_benchmarks(scales, repeat)
+    baseline = load_baseline(baseline_path)
+    if baseline:
+        log.info(f'\nCompared with {baseline_path}:')
+        regressions = compare(results, baseline)
+        for scale, name, metric in regressions:
+            log.warning(f'  ⚠ regression: {scale}/{name} {metric}')
+    else:
+        regressions = []
+    if save:
+        save_baseline(results, baseline_path)
+        log.info(f'\n✓ Saved baseline: {baseline_path}')
+    return 1 if check and regressions else 0
+
@@ -0,0 +1,362 @@
+"""Incremental build of the flow map data: each stage is skipped while its inputs,
+parameters and outputs are unchanged (see run_stage and main).
+
+The path constants are relative to the vis2 directory; the stages resolve
+them against a root argument rather than the working directory.
+"""
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from .aggregate_goods import GOODS_DATASETS, MIN_YEAR, aggregate_goods, write_goods
+from .arc_cache import ArcCache, DEFAULT_CACHE_PATH
+from .convert_csv_to_json import FLOW_SOURCES, country_coord_table, create_flow_lines
+from .excel_ingest import DEFAULT_SHEET_CACHE_DIR
+from .file_hash import file_sha256
+from .make_curved_flows_clip_topo import (FLOW_OUTPUTS, TOPO_PATH, clip_arcs, default_metric, feature_lines,
+                                          features_from_runs, flow_arcs, flow_bbox, flow_lines, write_flow_runs,
+                                          write_topojson)
+from .json_writer import COORD_PRECISION, VALUE_PRECISION, check_compress, compressed_paths, write_json
+from .pipeline_metrics import count, count_bytes, stage
+from .project_equal_earth import PROJECTED_SPEC_PATH, fit_size, project_features, project_topology, projected_spec
+from .simplify_basemap import BASEMAP_PATH, DEFAULT_MIN_AREA, DEFAULT_QUANTIZATION, simplify_topology, write_basemap
+from .topojson_index import DEFAULT_INDEX_DIR, build_hit_grid, decode_arcs, load_topology
+from .trade_cube import CUBE_PATH, build_cube, cube_sidecar, load_cube
+
+log = logging.getLogger(__name__)
+
+BUILD_DIR = 'build'
+STATE_PATH = os.path.join(BUILD_DIR, 'pipeline_state.json')
+FLOW_INDEX_PATH = 'data/flow_index.json'
+HIT_GRID_PATH = 'data/country_hit_grid.json'
+FLOW_SPEC_PATH = 'specs/flow_map.vg.json'
+SHARD_DIR = 'data/flow_shards'
+SHARD_MANIFEST_PATH = f'{SHARD_DIR}/manifest.json'
+SHARD_VERSION = 1
+# Bump when a stage's code changes in a way that alters its output
+STAGE_VERSION = 5
+
+def stage_key(name, inputs, params, root='.'):
+    payload = {
+        'stage': name,
+        'version': STAGE_VERSION,
+        'inputs': {path: file_sha256(os.path.join(root, path)) for path in inputs},
+        'params': params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _replace_with(path, lambda tmp: _dump_json(state, tmp, indent=2))
+
+def _dump_json(obj, path, **kwargs):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, **kwargs)
+
+def _replace_with(path, write):
+    """Write to a temporary sibling and rename, so a failed stage never leaves a half-written artifact"""
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+def run_stage(state, name, inputs, params, outputs, build, force=False, root='.'):
+    """Run build(outputs) unless the recorded key and output hashes still match.
+
+    inputs and outputs are relative to root, and recorded that way; build
+    gets the outputs resolved against root. Returns True if the stage ran.
+    """
+    key = stage_key(name, inputs, params, root)
+    previous = state.get(name)
+    files = [os.path.join(root, p) for p in outputs]
+    up_to_date = (
+        not force and previous is not None and previous['key'] == key
+        and all(os.path.exists(f) and file_sha256(f) == previous['outputs'].get(p) for p, f in zip(outputs, files))
+    )
+    if up_to_date:
+        log.info(f'  - {name}: up to date')
+        count('stages_up_to_date')
+        return False
+    for f in files:
+        os.makedirs(os.path.dirname(f) or '.', exist_ok=True)
+    with stage(name):
+        build(files)
+        count_bytes(files)
+    state[name] = {'key': key, 'outputs': {p: file_sha256(f) for p, f in zip(outputs, files)}}
+    log.info(f'  ✓ {name}')
+    return True
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# Adaptive arc sampling error in degrees (about a quarter pixel on the 1000px map)
+DEFAULT_TOLERANCE = 0.1
+# Flows drawn: yearly trade of at least $5B, from 2019 on
+DEFAULT_MIN_VALUE = 5
+DEFAULT_MIN_YEAR = 2019
+
+def _served(paths, compress=()):
+    """The files the site serves plus their precompressed siblings"""
+    return [out for p in paths for out in (p, *compressed_paths(p, compress))]
+
+def build_trade_cube(state, sources=None, force=False, root='.'):
+    """Ingest every flow type's table into the trade cube; sources overrides FLOW_SOURCES per flow type"""
+    sources = {**FLOW_SOURCES, **(sources or {})}
+    log.info('\nCUBE')
+
+    def cube(outputs):
+        tables = {flow_type: os.path.join(root, sources[flow_type]) for flow_type in sorted(FLOW_SOURCES)}
+        build_cube(tables, os.path.join(root, DEFAULT_SHEET_CACHE_DIR)).save(outputs[0])
+    run_stage(state, 'cube', [sources[flow_type] for flow_type in sorted(FLOW_SOURCES)], {},
+              [CUBE_PATH, cube_sidecar(CUBE_PATH)], cube, force, root)
+
+def build_flow_type(flow_type, state, fmt='topojson', n_points=24, tolerance=DEFAULT_TOLERANCE,
+                    cache=None, force=False, workers=None, min_value=DEFAULT_MIN_VALUE,
+                    min_year=DEFAULT_MIN_YEAR, compress=(), route='map', root='.'):
+    stage_dir = os.path.join(BUILD_DIR, flow_type)
+    aggregate_out = os.path.join(stage_dir, 'aggregate.json')
+    geometry_out = os.path.join(stage_dir, 'geometry.npz')
+    clip_out = os.path.join(stage_dir, 'clip.json')
+    serialize_out = FLOW_OUTPUTS[fmt].format(flow_type)
+
+    log.info(f'\n{flow_type.upper()}')
+
+    def aggregate(outputs):
+        records = load_cube(os.path.join(root, CUBE_PATH)).records(flow_type, min_value_b=min_value, min_year=min_year)
+        log.info(f"  Extracted {len(records)} records for {len({r['country'] for r in records})} countries")
+        coords_table = country_coord_table(os.path.join(root, TOPO_PATH), os.path.join(root, DEFAULT_INDEX_DIR))
+        flow_lines, missing = create_flow_lines(records, flow_type, coords_table)
+        if missing:
+            log.warning(f"  ⚠ missing coordinates: {', '.join(sorted(missing))}")
+        _replace_with(outputs[0], lambda tmp: _dump_json(flow_lines, tmp, indent=2))
+    run_stage(state, f'{flow_type}/aggregate', [CUBE_PATH, cube_sidecar(CUBE_PATH), TOPO_PATH],
+              {'min_value': min_value, 'min_year': min_year}, [aggregate_out], aggregate, force, root)
+
+    def geometry(outputs):
+        flows = _read_json(os.path.join(root, aggregate_out))
+        arcs = flow_arcs(flows, n_points=n_points, cache=cache, tolerance=tolerance,
+                         metric=default_metric(fmt), workers=workers, route=route)
+        lengths = [len(arc) for arc in arcs]
+        coords = np.concatenate(arcs) if arcs else np.zeros((0, 2))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        # np.savez appends .npz to names that lack it, so hand it an open file
+        def write(tmp):
+            with open(tmp, 'wb') as f:
+                np.savez(f, coords=coords, offsets=offsets)
+        _replace_with(outputs[0], write)
+    run_stage(state, f'{flow_type}/geometry', [aggregate_out],
+              {'n_points': n_points, 'tolerance': tolerance, 'metric': default_metric(fmt), 'route': route},
+              [geometry_out], geometry, force, root)
+
+    def clip(outputs):
+        bbox = flow_bbox(os.path.join(root, TOPO_PATH), route, os.path.join(root, DEFAULT_INDEX_DIR))
+        with np.load(os.path.join(root, geometry_out)) as geom:
+            offsets = geom['offsets']
+            arcs = np.split(geom['coords'], offsets[1:-1]) if len(offsets) > 1 else []
+        runs = clip_arcs(arcs, bbox, workers=workers)
+        _replace_with(outputs[0], lambda tmp: _dump_json(runs, tmp))
+    run_stage(state, f'{flow_type}/clip', [geometry_out, TOPO_PATH], {'route': route}, [clip_out], clip, force,
+              root)
+
+    def serialize(outputs):
+        write_flow_runs(_read_json(os.path.join(root, aggregate_out)), _read_json(os.path.join(root, clip_out)),
+                        outputs[0], fmt, compress=compress)
+    params = {'format': fmt, 'precision': COORD_PRECISION, 'value_precision': VALUE_PRECISION,
+              'compress': list(compress)}
+    run_stage(state, f'{flow_type}/serialize/{fmt}', [aggregate_out, clip_out], params,
+              _served([serialize_out], compress), serialize, force, root)
+
+def flow_threshold_index(flows):
+    """{year: {'countries': [...], 'values': [...]}} with each year sorted by value, largest first.
+
+    Countries meeting a threshold are then a prefix of the list, found by binary search.
+    """
+    by_year = {}
+    for f in flows:
+        year = by_year.setdefault(str(f['year']), {})
+        # Keep the largest value if a country appears more than once in a year
+        year[f['country']] = max(f['value'], year.get(f['country'], f['value']))
+    index = {}
+    for year in sorted(by_year):
+        ranked = sorted(by_year[year].items(), key=lambda kv: (-kv[1], kv[0]))
+        index[year] = {'countries': [c for c, _ in ranked], 'values': [v for _, v in ranked]}
+    return index
+
+def build_flow_index(state, force=False, compress=(), root='.'):
+    sources = {flow_type: os.path.join(BUILD_DIR, flow_type, 'aggregate.json') for flow_type in sorted(FLOW_SOURCES)}
+    sources = {flow_type: path for flow_type, path in sources.items() if os.path.exists(os.path.join(root, path))}
+
+    def index(outputs):
+        out = {flow_type: flow_threshold_index(_read_json(os.path.join(root, path)))
+               for flow_type, path in sources.items()}
+        write_json(out, outputs[0], compress)
+    log.info('\nINDEX')
+    run_stage(state, 'flow_index', list(sources.values()), {'compress': list(compress)},
+              _served([FLOW_INDEX_PATH], compress), index, force, root)
+
+def build_basemap(state, min_area=DEFAULT_MIN_AREA, quantization=DEFAULT_QUANTIZATION, force=False, compress=(),
+                  root='.'):
+    def basemap(outputs):
+        topo = load_topology(os.path.join(root, TOPO_PATH))
+        write_basemap(simplify_topology(topo, min_area, quantization), outputs[0], compress)
+    params = {'min_area': min_area, 'quantization': quantization, 'compress': list(compress)}
+    run_stage(state, 'basemap', [TOPO_PATH], params, _served([BASEMAP_PATH], compress), basemap, force,
+              root)
+
+def build_country_hit_grid(state, force=False, compress=(), root='.'):
+    # Built from the basemap the map draws, so hover hits match the outlines on screen
+    def grid(outputs):
+        write_json(build_hit_grid(load_topology(os.path.join(root, BASEMAP_PATH))), outputs[0], compress)
+    run_stage(state, 'hit_grid', [BASEMAP_PATH], {'compress': list(compress)}, _served([HIT_GRID_PATH], compress),
+              grid, force, root)
+
+def _built_flows(root='.'):
+    """{flow_type: [aggregate.json, clip.json]} of the flow types built so far, relative to root"""
+    flows = {}
+    for flow_type in sorted(FLOW_SOURCES):
+        stage_files = [os.path.join(BUILD_DIR, flow_type, name) for name in ('aggregate.json', 'clip.json')]
+        if all(os.path.exists(os.path.join(root, p)) for p in stage_files):
+            flows[flow_type] = stage_files
+    return flows
+
+def flow_source_name(flow_type):
+    """Name of the flow map's data source for one flow type, filled by flow_map_controller.js"""
+    return f'flows_{flow_type}'
+
+def shard_path(flow_type, year):
+    return f'{SHARD_DIR}/{flow_type}_{year}.topojson'
+
+def build_flow_shards(state, force=False, compress=(), root='.'):
+    """One flow TopoJSON per (flowType, year) plus a manifest, so the map loads only the visible flows"""
+    flows = _built_flows(root)
+    years = {flow_type: sorted({f['year'] for f in _read_json(os.path.join(root, aggregate_out))})
+             for flow_type, (aggregate_out, _) in flows.items()}
+    shards = [shard_path(flow_type, year) for flow_type in years for year in years[flow_type]]
+
+    def shard(outputs):
+        manifest = {'version': SHARD_VERSION, 'format': {'type': 'topojson', 'feature': 'flows'}, 'shards': {}}
+        for flow_type, (aggregate_out, clip_out) in flows.items():
+            by_year = {}
+            for f, runs in zip(_read_json(os.path.join(root, aggregate_out)),
+                               _read_json(os.path.join(root, clip_out))):
+                flow_data, year_runs = by_year.setdefault(f['year'], ([], []))
+                flow_data.append(f); year_runs.append(runs)
+            entries = manifest['shards'][flow_type] = {}
+            for year, (flow_data, year_runs) in sorted(by_year.items()):
+                path = shard_path(flow_type, year)
+                out_path = os.path.join(root, path)
+                write_topojson(lambda: flow_lines(flow_data, year_runs, VALUE_PRECISION), out_path, compress)
+                # Counted from the features written: flows clipping dropped entirely are not in the shard
+                values = [properties['value'] for properties, _ in flow_lines(flow_data, year_runs, VALUE_PRECISION)]
+                entries[str(year)] = {'url': path, 'bytes': os.path.getsize(out_path), 'flows': len(values),
+                                      'min_value': min(values, default=None), 'max_value': max(values, default=None)}
+        # Years no longer in the data leave no stale shards behind
+        for name in os.listdir(os.path.join(root, SHARD_DIR)):
+            path = os.path.join(root, SHARD_DIR, name)
+            if '.topojson' in name and path not in outputs:
+                os.remove(path)
+        write_json(manifest, os.path.join(root, SHARD_MANIFEST_PATH), compress)
+    log.info('\nSHARDS')
+    run_stage(state, 'shards', [p for stage_files in flows.values() for p in stage_files],
+              {'value_precision': VALUE_PRECISION, 'compress': list(compress)},
+              _served([*shards, SHARD_MANIFEST_PATH], compress), shard, force, root)
+
+def projected_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}_projected{ext}'
+
+def build_projected(state, quantization=DEFAULT_QUANTIZATION, force=False, compress=(), root='.'):
+    """Basemap, flows and flow map spec pre-projected to equalEarth pixels for the spec's width/height"""
+    flows = _built_flows(root)
+    flow_paths = {FLOW_OUTPUTS['topojson'].format(flow_type): flow_type for flow_type in flows}
+    urls = {path: projected_path(path) for path in [BASEMAP_PATH, *flow_paths]}
+    # The spec's flow layers read the shards the controller loads; these draw whole projected files instead
+    named = {flow_source_name(flow_type): {'url': urls[path], 'format': {'type': 'topojson', 'feature': 'flows'}}
+             for path, flow_type in flow_paths.items()}
+
+    def project(outputs):
+        spec = _read_json(os.path.join(root, FLOW_SPEC_PATH))
+        basemap = load_topology(os.path.join(root, BASEMAP_PATH))
+        # Vega-Lite fits the projection to the layers' data; the basemap spans all of it
+        fit = fit_size(decode_arcs(basemap)[0], spec['width'], spec['height'])
+        out = project_topology(basemap, fit, quantization)
+        write_basemap(out, os.path.join(root, urls[BASEMAP_PATH]), compress)
+        for path, flow_type in flow_paths.items():
+            aggregate_out, clip_out = flows[flow_type]
+            features = features_from_runs(_read_json(os.path.join(root, aggregate_out)),
+                                          _read_json(os.path.join(root, clip_out)), value_precision=VALUE_PRECISION)
+            features = project_features(features, fit)
+            write_topojson(lambda: feature_lines(features), os.path.join(root, urls[path]), compress,
+                           quantization=quantization)
+        out_spec = projected_spec(spec, fit, urls, named)
+        _replace_with(os.path.join(root, PROJECTED_SPEC_PATH),
+                      lambda tmp: _dump_json(out_spec, tmp, indent=2, ensure_ascii=False))
+    log.info('\nPROJECTED')
+    inputs = [FLOW_SPEC_PATH, BASEMAP_PATH, *(p for stage_files in flows.values() for p in stage_files)]
+    run_stage(state, 'projected', inputs, {'quantization': quantization, 'compress': list(compress)},
+              [*_served(urls.values(), compress), PROJECTED_SPEC_PATH], project, force, root)
+
+def build_goods(state, force=False, root='.'):
+    log.info('\nGOODS')
+    for name, dataset in GOODS_DATASETS.items():
+        def goods(outputs, dataset=dataset):
+            out = aggregate_goods(os.path.join(root, dataset['source']), dataset,
+                                  cache_dir=os.path.join(root, DEFAULT_SHEET_CACHE_DIR))
+            _replace_with(outputs[0], lambda tmp: write_goods(out, tmp))
+        # The category table is part of the key, so editing a rule rebuilds the dataset
+        params = {**{k: v for k, v in dataset.items() if k not in ('source', 'output')}, 'min_year': MIN_YEAR}
+        run_stage(state, f'goods/{name}', [dataset['source']], params, [dataset['output']], goods, force,
+                  root)
+
+def main(flow_types=None, fmt='topojson', n_points=24, tolerance=DEFAULT_TOLERANCE, force=False,
+         cache_path=DEFAULT_CACHE_PATH, workers=None, sources=None, projected=False, shards=False, compress=(),
+         min_value=DEFAULT_MIN_VALUE, min_year=DEFAULT_MIN_YEAR, route='map', root='.'):
+    """Run every stage, in order:
+
+    cube                  ABS tables -> country x half-year x direction trade cube (build/trade_cube.npy)
+    <flowType>/aggregate  cube records of at least min_value $B from min_year -> straight flow lines
+    <flowType>/geometry, /clip, /serialize/<fmt>  curved flows (routed per route), clipped -> FLOW_OUTPUTS[fmt]
+    flow_index            (flowType, year) countries the map highlights
+    shards                with shards, one flow file per (flowType, year) and a manifest
+    basemap               simplified basemap
+    hit_grid              country hit-test grid of the simplified basemap for the hover tooltips
+    projected             with projected, equalEarth pre-projected geometry and spec
+    goods/<name>          goods stacked-area datasets
+
+    Artifacts go under build/ (or the served paths); stage keys live in build/pipeline_state.json.
+    Every path, including sources and cache_path, is relative to root, the
+    vis2 directory; the working directory is never changed.
+    """
+    # Fail before any stage runs if brotli is missing
+    check_compress(compress)
+    state_path = os.path.join(root, STATE_PATH)
+    state = load_state(state_path)
+    cache = ArcCache(cache_path and os.path.join(root, cache_path))
+    try:
+        build_trade_cube(state, sources, force=force, root=root)
+        for flow_type in flow_types or sorted(FLOW_SOURCES):
+            build_flow_type(flow_type, state, fmt=fmt, n_points=n_points, tolerance=tolerance, cache=cache,
+                            force=force, workers=workers, min_value=min_value, min_year=min_year,
+                            compress=compress, route=route, root=root)
+        build_flow_index(state, force=force, compress=compress, root=root)
+        if shards:
+            build_flow_shards(state, force=force, compress=compress, root=root)
+        build_basemap(state, force=force, compress=compress, root=root)
+        build_country_hit_grid(state, force=force, compress=compress, root=root)
+        if projected:
+            build_projected(state, force=force, compress=compress, root=root)
+        build_goods(state, force=force, root=root)
+    finally:
+        # Keep the record of whatever finished, even if a later stage failed
+        save_state(state, state_path)
+        cache.save()
+
@@ -0,0 +1,220 @@
+"""Command line entry point of the pipeline:
+
+    python -m trade_pipeline [--root DIR] <command> [options]
+
+Paths are relative to --root, the vis2 directory the site is served from
+(default: the current directory). Each command imports its modules only once
+it has been chosen, so curve and basemap never load pandas and the top-level
+--help loads nothing. The pipeline modules report progress through logging;
+main() is what shows it.
+"""
+import argparse
+import logging
+import os
+import sys
+
+def _metrics_args(parser, what='per-stage time, memory and counters'):
+    parser.add_argument('--metrics', metavar='PATH', help=f'write {what} as JSON')
+    parser.add_argument('--profile', metavar='PATH', help='dump cProfile stats of the slowest stage')
+
+def _source_args(parser, sources):
+    for flow_type, path in sources.items():
+        parser.add_argument(f'--{flow_type}', metavar='PATH', default=path,
+                            help=f'ABS {flow_type} table, .xlsx or .csv (default: %(default)s)')
+
+def _route_args(parser, routes):
+    parser.add_argument('--route', choices=routes, default=routes[0],
+                        help='map: flows crossing the date line go the other way round, staying on the lon/lat map; '
+                             'short: the shorter great-circle way, for projections that split lines at the '
+                             'antimeridian (default: %(default)s)')
+
+def _sources(args, sources):
+    return {flow_type: getattr(args, flow_type) for flow_type in sources}
+
+def _build(parser):
+    from .arc_cache import DEFAULT_CACHE_PATH
+    from .build_pipeline import (DEFAULT_MIN_VALUE, DEFAULT_MIN_YEAR, DEFAULT_TOLERANCE, FLOW_SOURCES,
+                                 PROJECTED_SPEC_PATH, SHARD_MANIFEST_PATH, main)
+    from .json_writer import COMPRESSIONS
+    from .make_curved_flows_clip_topo import FLOW_OUTPUTS, ROUTES
+    from .pipeline_metrics import metrics_run
+
+    parser.add_argument('--flows', nargs='+', choices=sorted(FLOW_SOURCES),
+                        help='flow types to build (default: all)')
+    _source_args(parser, FLOW_SOURCES)
+    # Thresholds are queries on the trade cube, so changing them never re-ingests the tables
+    parser.add_argument('--min-value', type=float, default=DEFAULT_MIN_VALUE,
+                        help='smallest yearly trade drawn as a flow, in $B (default: %(default)s)')
+    parser.add_argument('--min-year', type=int, default=DEFAULT_MIN_YEAR,
+                        help='first year drawn (default: %(default)s)')
+    parser.add_argument('--format', choices=sorted(FLOW_OUTPUTS), default='topojson',
+                        help='flow output layout (default: %(default)s)')
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                          help='adaptive arc sampling error in degrees (default: %(default)s)')
+    sampling.add_argument('--n-points', type=int,
+                          help='use this many fixed samples per arc instead of adaptive sampling')
+    _route_args(parser, ROUTES)
+    parser.add_argument('--shards', action='store_true',
+                        help=f'also write one flow file per flow type and year, listed in {SHARD_MANIFEST_PATH}')
+    parser.add_argument('--projected', action='store_true',
+                        help=f'also write equalEarth pre-projected geometry and {PROJECTED_SPEC_PATH}')
+    parser.add_argument('--compress', nargs='+', choices=COMPRESSIONS, default=[],
+                        help='also write precompressed siblings of the served files (.br needs brotli)')
+    parser.add_argument('--force', action='store_true', help='rebuild every stage')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH,
+                        help='arc geometry cache file (default: %(default)s)')
+    # Output does not depend on the worker count, so it is not part of any stage key
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes for arc sampling and clipping (default: %(default)s)')
+    _metrics_args(parser, 'per-stage time, memory and counters of the stages that ran')
+
+    def run(args):
+        fixed = args.n_points is not None
+        with metrics_run(args.metrics, args.profile):
+            main(args.flows, fmt=args.format, n_points=args.n_points if fixed else 24,
+                 tolerance=None if fixed else args.tolerance,
+                 force=args.force, cache_path=args.cache, workers=args.workers,
+                 sources=_sources(args, FLOW_SOURCES), projected=args.projected,
+                 shards=args.shards, compress=tuple(args.compress), min_value=args.min_value,
+                 min_year=args.min_year, route=args.route, root=args.root)
+    return run
+
+def _convert(parser):
+    from .convert_csv_to_json import FLOW_SOURCES, STRAIGHT_FLOW_LINES, TOPO_PATH, main
+    from .pipeline_metrics import metrics_run
+
+    _source_args(parser, FLOW_SOURCES)
+    parser.add_argument('--out', metavar='PATTERN', default=STRAIGHT_FLOW_LINES,
+                        help='output path, {} is the flow type (default: %(default)s)')
+    parser.add_argument('--topo', default=TOPO_PATH,
+                        help='basemap whose centroids fill in missing coordinates (default: %(default)s)')
+    _metrics_args(parser)
+
+    def run(args):
+        with metrics_run(args.metrics, args.profile):
+            main(_sources(args, FLOW_SOURCES), args.out, args.topo)
+    return run
+
+def _curve(parser):
+    from .arc_cache import DEFAULT_CACHE_PATH
+    from .json_writer import COMPRESSIONS, COORD_PRECISION, VALUE_PRECISION
+    from .make_curved_flows_clip_topo import (FLOW_OUTPUTS, MAP_WIDTH, ROUTES, STRAIGHT_FLOW_LINES, TOPO_PATH, main,
+                                              pixel_tolerance)
+    from .pipeline_metrics import metrics_run
+
+    parser.add_argument('--format', choices=sorted(FLOW_OUTPUTS), default='segments',
+                        help='segments: one record per segment (default); geojson/topojson: one feature per flow')
+    parser.add_argument('--flow-lines', metavar='PATTERN', default=STRAIGHT_FLOW_LINES,
+                        help='straight flow lines, {} is the flow type (default: %(default)s)')
+    parser.add_argument('--out', metavar='PATTERN',
+                        help='output path, {} is the flow type (default: by --format, e.g. '
+                             f'{FLOW_OUTPUTS["segments"]})')
+    parser.add_argument('--topo', default=TOPO_PATH,
+                        help='basemap the flows are clipped to (default: %(default)s)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH,
+                        help='arc geometry cache file (default: %(default)s)')
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument('--tolerance', type=float,
+                          help='sample arcs adaptively to this error in degrees instead of 24 fixed samples')
+    sampling.add_argument('--pixel-tolerance', type=float,
+                          help=f'adaptive sampling error in pixels on the {MAP_WIDTH}px-wide map')
+    sampling.add_argument('--lod', type=float, nargs='+', metavar='TOLERANCE',
+                          help='write one adaptive level of detail per tolerance (degrees) as *_lod<N> files')
+    _route_args(parser, ROUTES)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes for arc sampling and clipping (default: %(default)s)')
+    parser.add_argument('--precision', type=int, default=COORD_PRECISION,
+                        help='decimals kept for coordinates in segments/geojson output (default: %(default)s)')
+    parser.add_argument('--value-precision', type=int, default=VALUE_PRECISION,
+                        help='decimals kept for trade values (default: %(default)s)')
+    parser.add_argument('--compress', nargs='+', choices=COMPRESSIONS, default=[],
+                        help='also write precompressed siblings (.br needs the brotli package)')
+    _metrics_args(parser)
+
+    def run(args):
+        tolerance = args.tolerance
+        if args.pixel_tolerance is not None:
+            tolerance = pixel_tolerance(args.pixel_tolerance)
+        with metrics_run(args.metrics, args.profile):
+            return main(args.format, args.cache, tolerance=tolerance, lod=args.lod, workers=args.workers,
+                        precision=args.precision, value_precision=args.value_precision,
+                        compress=tuple(args.compress), topo_path=args.topo, input_pattern=args.flow_lines,
+                        output_pattern=args.out, route=args.route)
+    return run
+
+def _basemap(parser):
+    from .make_curved_flows_clip_topo import TOPO_PATH
+    from .simplify_basemap import BASEMAP_PATH, DEFAULT_MIN_AREA, DEFAULT_QUANTIZATION, main
+
+    parser.add_argument('--topo', default=TOPO_PATH, help='source TopoJSON (default: %(default)s)')
+    parser.add_argument('--out', default=BASEMAP_PATH, help='output TopoJSON (default: %(default)s)')
+    parser.add_argument('--min-area', type=float, default=DEFAULT_MIN_AREA,
+                        help='Visvalingam area threshold in square degrees (default: %(default)s)')
+    parser.add_argument('--quantization', type=int, default=DEFAULT_QUANTIZATION,
+                        help='quantization grid size per axis (default: %(default)s)')
+
+    def run(args):
+        main(args.topo, args.out, args.min_area, args.quantization)
+    return run
+
+def _goods(parser):
+    from .aggregate_goods import main
+
+    def run(args):
+        main()
+    return run
+
+def _benchmark(parser):
+    from .benchmark_pipeline import BASELINE_PATH, SCALES, main
+
+    parser.add_argument('--scale', nargs='+', choices=list(SCALES), default=['small'],
+                        help='input scales to run (default: small)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case; the best is kept (default: 3)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 if anything regressed')
+
+    def run(args):
+        return main(args.scale, args.repeat, args.baseline, save=args.save_baseline, check=args.check)
+    return run
+
+# Commands resolving their paths against --root themselves; the others run in it
+ROOTED_COMMANDS = {'build'}
+
+# Command -> (function adding its arguments and returning its runner, description)
+COMMANDS = {
+    'build': (_build, 'Incrementally build the flow map data artifacts.'),
+    'convert': (_convert, 'Convert the ABS country tables to straight flow line JSON.'),
+    'curve': (_curve, 'Curve and clip the straight flow lines for the flow map.'),
+    'basemap': (_basemap, 'Simplify and re-quantize the flow map basemap.'),
+    'goods': (_goods, 'Pre-aggregate the goods stacked-area datasets.'),
+    'benchmark': (_benchmark, 'Benchmark the flow map data pipeline on synthetic inputs.'),
+}
+
+def main(argv=None):
+    """Run one command; returns its exit status"""
+    parser = argparse.ArgumentParser(
+        prog='python -m trade_pipeline', description='Build the data files of the trade flow map.',
+        epilog='commands:\n' + '\n'.join(f'  {name:<10} {desc}' for name, (_, desc) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--root', default='.',
+                        help='vis2 directory the paths are relative to (default: current directory)')
+    parser.add_argument('command', choices=list(COMMANDS), help='see below; <command> --help for its options')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    add_arguments, description = COMMANDS[args.command]
+    command = argparse.ArgumentParser(prog=f'{parser.prog} {args.command}', description=description)
+    run = add_arguments(command)
+    options = command.parse_args(args.args)
+    options.root = args.root
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    if args.command in ROOTED_COMMANDS:
+        return run(options) or 0
+    cwd = os.getcwd()
+    os.chdir(args.root)
+    try:
+        return run(options) or 0
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,346 @@
+"""Ingest the ABS six-month country tables and write the straight flow lines.
+
+ingest_csv, aggregate_trade and create_flow_lines are the pure steps the
+incremental build runs one by one; main() runs them for both flow types and
+writes data/straight_flow_lines_*.json for the curve step. pandas is imported
+by the functions that read tables, so importing this module stays cheap.
+"""
+import logging
+import os
+import re
+
+from .excel_ingest import DEFAULT_SHEET_CACHE_DIR, detect_header_row, load_sheet
+from .json_writer import COORD_PRECISION, VALUE_PRECISION, round_value, write_json_records
+from .pipeline_metrics import count, count_bytes, stage
+
+log = logging.getLogger(__name__)
+
+# Country coordinates (latitude, longitude for country centroids)
+COUNTRY_COORDS = {
+    'Australia': {'lat': -25.2744, 'lon': 133.7751},
+    'China': {'lat': 35.8617, 'lon': 104.1954},
+    'Japan': {'lat': 36.2048, 'lon': 138.2529},
+    'South Korea': {'lat': 35.9078, 'lon': 127.7669},
+    'United States': {'lat': 37.0902, 'lon': -95.7129},
+    'India': {'lat': 20.5937, 'lon': 78.9629},
+    'Thailand': {'lat': 15.8700, 'lon': 100.9925},
+    'Taiwan': {'lat': 23.6978, 'lon': 120.9605},
+    'New Zealand': {'lat': -40.9006, 'lon': 174.8860},
+    'Malaysia': {'lat': 4.2105, 'lon': 101.9758},
+    'Singapore': {'lat': 1.3521, 'lon': 103.8198},
+    'United Kingdom': {'lat': 55.3781, 'lon': -3.4360},
+    'Germany': {'lat': 51.1657, 'lon': 10.4515},
+    'Vietnam': {'lat': 14.0583, 'lon': 108.2772},
+    'Indonesia': {'lat': -0.7893, 'lon': 113.9213},
+    'Hong Kong': {'lat': 22.3193, 'lon': 114.1694},
+    'Canada': {'lat': 56.1304, 'lon': -106.3468},
+    'France': {'lat': 46.2276, 'lon': 2.2137},
+    'Italy': {'lat': 41.8719, 'lon': 12.5674},
+    'Netherlands': {'lat': 52.1326, 'lon': 5.2913},
+    'Belgium': {'lat': 50.5039, 'lon': 4.4699},
+    'Spain': {'lat': 40.4637, 'lon': -3.7492},
+    'Switzerland': {'lat': 46.8182, 'lon': 8.2275},
+    'Brazil': {'lat': -14.2350, 'lon': -51.9253},
+    'Mexico': {'lat': 23.6345, 'lon': -102.5528},
+    'Saudi Arabia': {'lat': 23.8859, 'lon': 45.0792},
+    'United Arab Emirates': {'lat': 23.4241, 'lon': 53.8478},
+    'Philippines': {'lat': 12.8797, 'lon': 121.7740},
+    'Papua New Guinea': {'lat': -6.3150, 'lon': 143.9555},
+    'Fiji': {'lat': -17.7134, 'lon': 178.0650},
+    'Bangladesh': {'lat': 23.6850, 'lon': 90.3563},
+    'Pakistan': {'lat': 30.3753, 'lon': 69.3451},
+    'Chile': {'lat': -35.6751, 'lon': -71.5430},
+    'Peru': {'lat': -9.1900, 'lon': -75.0152},
+    'South Africa': {'lat': -30.5595, 'lon': 22.9375},
+    'Israel': {'lat': 31.0461, 'lon': 34.8516},
+    'Poland': {'lat': 51.9194, 'lon': 19.1451},
+    'Turkey': {'lat': 38.9637, 'lon': 35.2433},
+    'Russia': {'lat': 61.5240, 'lon': 105.3188},
+    'Argentina': {'lat': -38.4161, 'lon': -63.6167},
+    'Colombia': {'lat': 4.5709, 'lon': -74.2973},
+    'Egypt': {'lat': 26.8206, 'lon': 30.8025},
+    'Kenya': {'lat': -0.0236, 'lon': 37.9062},
+    'Nigeria': {'lat': 9.0820, 'lon': 8.6753},
+    'Oman': {'lat': 21.4735, 'lon': 55.9754},
+    'Qatar': {'lat': 25.3548, 'lon': 51.1839},
+    'Bahrain': {'lat': 26.0667, 'lon': 50.5577},
+    'Kuwait': {'lat': 29.3117, 'lon': 47.4818},
+}
+
+def parse_period_to_year(period_str):
+    """Extract year from period string like 'July 2018 to December 2018'"""
+    import pandas as pd
+    if pd.isna(period_str):
+        return None
+    # Get the last year mentioned
+    years = re.findall(r'\d{4}', str(period_str))
+    if years:
+        return int(years[-1])
+    return None
+
+COUNTRY_NAME_MAPPING = {
+    'Korea, Republic of (South)': 'South Korea',
+    'United States of America': 'United States',
+    'Hong Kong (SAR of China)': 'Hong Kong',
+    'Viet Nam': 'Vietnam',
+    'China (excludes SARs and Taiwan)': 'China',
+    'United Kingdom (c)': 'United Kingdom',
+}
+
+def normalize_country_name(country):
+    """Normalize country names to match coordinates"""
+    country = str(country).strip()
+    return COUNTRY_NAME_MAPPING.get(country, country)
+
+def normalize_country_names(countries):
+    """Vectorized normalize_country_name for a Series of names"""
+    countries = countries.astype(str).str.strip()
+    return countries.replace(COUNTRY_NAME_MAPPING)
+
+def parse_period_years(periods):
+    """Vectorized parse_period_to_year: last 4-digit year in each period header"""
+    import pandas as pd
+    years = periods.astype('string').str.findall(r'\d{4}').str[-1]
+    return pd.to_numeric(years, errors='coerce')
+
+def read_source_table(path, cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """Raw cells of an ABS table, from the workbook itself (parsed sheets cached in cache_dir) or a CSV export of it"""
+    if path.lower().endswith('.xlsx'):
+        return load_sheet(path, cache_dir=cache_dir)
+    import pandas as pd
+    return pd.read_csv(path, header=None, dtype=str, keep_default_na=False, na_values=[''])
+
+# Six-month period header -> half of the year, e.g. 'July 2018 to December 2018' is 2; footnote marks may follow
+HALF_YEAR_PATTERN = r'^\s*(January|July)\s+((?:19|20)\d{2})\s+to\s+(June|December)\s+\2\b'
+HALF_YEAR_MONTHS = {('January', 'June'): 1, ('July', 'December'): 2}
+
+def parse_period_halves(periods):
+    """Half of the year (1 or 2) of each six-month period header, e.g. 2 for 'July 2018 to December 2018'.
+
+    Strict, for the trade cube's half-year axis: raises ValueError for any
+    other header, e.g. a month or a quarter.
+    """
+    import pandas as pd
+    months = periods.astype('string').str.extract(HALF_YEAR_PATTERN)
+    halves = [HALF_YEAR_MONTHS.get((first, last)) for first, last in zip(months[0], months[2])]
+    bad = [period for period, half in zip(periods, halves) if half is None]
+    if bad:
+        raise ValueError(f'not a six-month period January-June or July-December: {bad}')
+    return pd.Series(halves, index=periods.index, dtype='int64')
+
+def ingest_periods(csv_path, flow_type, cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """Read an ABS table (.csv or .xlsx) into a DataFrame of country, period, year and value in $M.
+
+    period is the column's header and year the last year it names, so any
+    period length (six-month, monthly, ...) ingests. Suppressed ('np'), blank
+    and non-positive cells are dropped; nothing else is filtered.
+    """
+    import pandas as pd
+    df = read_source_table(csv_path, cache_dir)
+    
+    # The row of period headers sits under a title block of varying height
+    header_row = detect_header_row(df)
+    data_start_row = header_row + 1
+    country_col = 0
+    data_start_col = 1
+    
+    # Parse the period header once: column -> year
+    periods = df.iloc[header_row, data_start_col:]
+    years = parse_period_years(periods)
+    years = years[years.notna() & (years != 0)].astype(int)
+    
+    log.info(f"\n{flow_type.upper()}: Found {len(years)} periods from {years.iloc[0]} to {years.iloc[-1]}")
+    
+    # Country rows, normalized and with totals dropped
+    data = df.iloc[data_start_row:, [country_col] + list(years.index)]
+    data = data[data[country_col].notna()].rename(columns={country_col: 'country'})
+    data['country'] = normalize_country_names(data['country'])
+    data = data[~(data['country'].str.contains('Total', regex=False) |
+                  data['country'].str.contains('All Countries', regex=False))]
+    count('rows_parsed', len(data))
+    
+    # Melt to long form (country, column, value); 'np' and blanks become NaN
+    long = data.melt(id_vars='country', var_name='col', value_name='value')
+    count('np_values_skipped', (long['value'].str.strip() == 'np').sum())
+    long['value'] = pd.to_numeric(long['value'], errors='coerce')
+    long = long[long['value'] > 0]
+    long['period'] = long['col'].map(periods)
+    long['year'] = long['col'].map(years)
+    return long[['country', 'period', 'year', 'value']]
+
+def ingest_csv(csv_path, flow_type):
+    """Read an ABS table (.csv or .xlsx) into country-year totals in $M (unfiltered)"""
+    long = ingest_periods(csv_path, flow_type)
+    
+    # Aggregate by country-year
+    yearly = long.groupby(['country', 'year'], sort=False)['value'].sum()
+    return [{'country': country, 'year': int(year), 'value': float(value_millions)}
+            for (country, year), value_millions in yearly.items()]
+
+def aggregate_trade(yearly_data, min_value=5, min_year=2019):
+    """Convert country-year totals from millions to billions and apply the map filters"""
+    # ONLY INCLUDE FLOWS >= $5B AND YEARS 2019-2024
+    results = []
+    for record in yearly_data:
+        value_billions = round(record['value'] / 1000, 2)  # Convert $M to $B
+        if value_billions >= min_value and record['year'] >= min_year:
+            results.append({
+                'country': record['country'],
+                'year': record['year'],
+                'value': value_billions
+            })
+    
+    results.sort(key=lambda x: (x['year'], x['country']))
+    count('records_kept', len(results))
+    count('records_filtered', len(yearly_data) - len(results))
+    
+    unique_countries = len(set(r['country'] for r in results))
+    log.info(f"  Extracted {len(results)} records for {unique_countries} countries")
+    return results
+
+def extract_from_csv(csv_path, flow_type):
+    """Extract trade data from an ABS table (.csv or .xlsx) and convert millions to billions"""
+    return aggregate_trade(ingest_csv(csv_path, flow_type))
+
+TOPO_PATH = 'specs/ne_110m_admin_0_countries.topojson'
+
+def country_coord_table(topo_path=TOPO_PATH, cache_dir=None):
+    """COUNTRY_COORDS, filled in with map centroids for any other country on the basemap
+
+    The basemap's index is cached in cache_dir, by default topojson_index's.
+    """
+    if not os.path.exists(topo_path):
+        return COUNTRY_COORDS
+    from .topojson_index import DEFAULT_INDEX_DIR, country_coords_from_index, load_topo_index
+    index = load_topo_index(topo_path, DEFAULT_INDEX_DIR if cache_dir is None else cache_dir)
+    return {**country_coords_from_index(index), **COUNTRY_COORDS}
+
+def _flow_lines_between(ends, coords_table):
+    """Flow lines for (properties, origin, destination) triples, skipping pairs with a missing or shared end.
+
+    Returns (flow_lines, countries without coordinates).
+    """
+    flow_lines = []
+    missing_coords = set()
+    
+    for properties, origin, destination in ends:
+        missing = {c for c in (origin, destination) if c not in coords_table}
+        if missing or origin == destination:
+            missing_coords |= missing
+            continue
+        
+        flow_lines.append({
+            **properties,
+            'origin_lon': coords_table[origin]['lon'],
+            'origin_lat': coords_table[origin]['lat'],
+            'dest_lon': coords_table[destination]['lon'],
+            'dest_lat': coords_table[destination]['lat']
+        })
+    
+    count('flows', len(flow_lines))
+    count('missing_coords', len(missing_coords))
+    return flow_lines, missing_coords
+
+def create_flow_lines(trade_data, flow_type, coords_table=None, reporter='Australia'):
+    """Create flow lines with coordinates between the reporting country and each partner"""
+    def ends(record):
+        country = record['country']
+        properties = {'country': country, 'year': record['year'], 'value': record['value']}
+        # Exports leave the reporter, imports arrive at it
+        return (properties, reporter, country) if flow_type == 'exports' else (properties, country, reporter)
+    return _flow_lines_between(map(ends, trade_data), coords_table or COUNTRY_COORDS)
+
+def create_pair_flow_lines(trade_data, coords_table=None):
+    """Flow lines for many-to-many trade records with 'origin', 'destination', 'year' and 'value'"""
+    def ends(record):
+        origin, destination = record['origin'], record['destination']
+        properties = {'country': destination, 'origin': origin, 'destination': destination,
+                      'year': record['year'], 'value': record['value']}
+        return properties, origin, destination
+    return _flow_lines_between(map(ends, trade_data), coords_table or COUNTRY_COORDS)
+
+STRAIGHT_FLOW_LINES = 'data/straight_flow_lines_{}.json'
+# The ABS workbooks are read directly; their CSV exports work too
+FLOW_SOURCES = {
+    'exports': 'data/excel files/merch exports by country 6 months.xlsx',
+    'imports': 'data/excel files/merch imports by country 6 months.xlsx',
+}
+FLOW_LINE_COORDS = ('origin_lon', 'origin_lat', 'dest_lon', 'dest_lat')
+
+def round_flow_line(line, precision=COORD_PRECISION, value_precision=VALUE_PRECISION):
+    """Copy of a flow line with its coordinates and value rounded for output"""
+    out = dict(line)
+    for key in FLOW_LINE_COORDS:
+        out[key] = round_value(out[key], precision)
+    out['value'] = round_value(out['value'], value_precision)
+    return out
+
+def write_flow_lines(trade_data, flow_type, output_file=None, coords_table=None):
+    """Create and save the straight flow lines for one flow type"""
+    output_file = output_file or STRAIGHT_FLOW_LINES.format(flow_type)
+    flow_lines, missing = create_flow_lines(trade_data, flow_type, coords_table)
+    write_json_records((round_flow_line(line) for line in flow_lines), output_file)
+    count_bytes([output_file])
+    
+    countries = sorted(set(item['country'] for item in flow_lines))
+    years = sorted(set(item['year'] for item in flow_lines))
+    log.info(f"✓ Saved: {output_file}")
+    log.info(f"  - {len(flow_lines)} flow lines")
+    log.info(f"  - {len(countries)} countries: {', '.join(countries[:5])}...")
+    log.info(f"  - Years: {years[0]} to {years[-1]}")
+    return missing
+
+def main(sources=None, output_pattern=STRAIGHT_FLOW_LINES, topo_path=TOPO_PATH):
+    """Write the straight flow lines of both flow types; sources overrides FLOW_SOURCES per flow type"""
+    sources = {**FLOW_SOURCES, **(sources or {})}
+    log.info("="*70)
+    log.info("Converting CSV files to JSON (Values in $Billions)")
+    log.info("="*70)
+    
+    # Extract exports data
+    log.info("\nProcessing EXPORTS...")
+    with stage('exports/ingest'):
+        exports_yearly = ingest_csv(sources['exports'], 'exports')
+    with stage('exports/aggregate'):
+        exports_data = aggregate_trade(exports_yearly)
+    
+    # Extract imports data
+    log.info("\nProcessing IMPORTS...")
+    with stage('imports/ingest'):
+        imports_yearly = ingest_csv(sources['imports'], 'imports')
+    with stage('imports/aggregate'):
+        imports_data = aggregate_trade(imports_yearly)
+    
+    log.info("\n" + "="*70)
+    log.info("Creating flow line JSON files")
+    log.info("="*70)
+    
+    # Create exports flow lines
+    log.info("\nCreating EXPORTS flow lines...")
+    with stage('coords'):
+        coords_table = country_coord_table(topo_path)
+    with stage('exports/flow_lines'):
+        missing_exports = write_flow_lines(exports_data, 'exports', output_pattern.format('exports'), coords_table)
+    
+    # Create imports flow lines
+    log.info("\nCreating IMPORTS flow lines...")
+    with stage('imports/flow_lines'):
+        missing_imports = write_flow_lines(imports_data, 'imports', output_pattern.format('imports'), coords_table)
+    
+    # Report missing coordinates
+    all_missing = missing_exports | missing_imports
+    if all_missing:
+        log.info("\n" + "="*70)
+        log.warning(f"⚠ WARNING: {len(all_missing)} countries missing coordinates:")
+        for country in sorted(all_missing):
+            log.info(f"  - {country}")
+        log.info("\nAdd these to COUNTRY_COORDS if needed")
+    else:
+        log.info("\n✓ All countries have coordinates!")
+    
+    log.info("\n" + "="*70)
+    log.info("DONE! Created straight flow line JSON files with values in $Billions")
+    log.info("  - " + output_pattern.format('exports'))
+    log.info("  - " + output_pattern.format('imports'))
+    log.info("Run python -m trade_pipeline curve (or build) to curve them")
+    log.info("="*70)
@@ -0,0 +1,116 @@
+"""Read the ABS workbooks in data/excel files/ directly, without exporting them to CSV.
+
+Sheets are streamed with openpyxl in read-only mode into a DataFrame of cell
+strings, the same shape pd.read_csv(header=None, dtype=str) gives for an
+exported CSV. Each parsed sheet is cached under the workbook's content hash as
+Feather (or pickle when pyarrow is not installed), so re-runs skip the XLSX
+parse until the workbook changes. pandas and openpyxl are imported only when
+a sheet is read.
+"""
+import datetime
+import os
+import re
+
+from .file_hash import file_sha256
+
+SHEET_CACHE_VERSION = 1
+DEFAULT_SHEET_CACHE_DIR = '.cache'
+# A period header names a year, e.g. 'July 2013 to December 2013'
+PERIOD_PATTERN = r'\b(?:19|20)\d{2}\b'
+
+def _cell_text(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    text = str(value)
+    return text if text.strip() else None
+
+def read_sheet(path, sheet=None):
+    """All cells of one worksheet (default: the first) as strings, blank cells NaN"""
+    import pandas as pd
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.worksheets[0]
+        rows = [[_cell_text(v) for v in row] for row in ws.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+    df = pd.DataFrame(rows, dtype=str)
+    # Formatting can stretch the sheet's used range far past the last filled column
+    filled = df.notna().any(axis=0).to_numpy().nonzero()[0]
+    return df.iloc[:, :filled[-1] + 1] if len(filled) else df
+
+def _cache_format():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'pkl'
+    return 'feather'
+
+def _read_cached(path, fmt):
+    import pandas as pd
+    if fmt == 'feather':
+        df = pd.read_feather(path)
+        # Feather needs string column names; restore read_csv's integer positions
+        df.columns = df.columns.astype(int)
+        return df
+    return pd.read_pickle(path)
+
+def _write_cached(df, path, fmt):
+    tmp = path + '.tmp'
+    if fmt == 'feather':
+        df.set_axis(df.columns.astype(str), axis=1).reset_index(drop=True).to_feather(tmp)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, path)
+
+def load_sheet(path, sheet=None, cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """read_sheet(), cached on disk under the workbook's content hash"""
+    if not cache_dir:
+        return read_sheet(path, sheet)
+    fmt = _cache_format()
+    name = re.sub(r'\W+', '_', sheet) if sheet else 'first'
+    digest = file_sha256(path)
+    cache_path = os.path.join(cache_dir, f'sheet_{digest[:16]}_{name}_v{SHEET_CACHE_VERSION}.{fmt}')
+    if os.path.exists(cache_path):
+        try:
+            return _read_cached(cache_path, fmt)
+        except (OSError, ValueError, EOFError):
+            pass
+    df = read_sheet(path, sheet)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_cached(df, cache_path, fmt)
+    return df
+
+def detect_header_row(table, min_periods=2, max_scan=50):
+    """Index of the row labelling the data columns.
+
+    That is the 'Series ID' row of an ABS time series sheet, or else the first
+    row with at least min_periods period headers after the label column.
+    """
+    head = table.iloc[:max_scan]
+    labels = head.iloc[:, 0]
+    series_id = (labels == 'Series ID').to_numpy().nonzero()[0]
+    if len(series_id):
+        return int(series_id[0])
+    periods = head.iloc[:, 1:].apply(lambda col: col.str.contains(PERIOD_PATTERN, na=False)).sum(axis=1)
+    matches = (periods >= min_periods).to_numpy().nonzero()[0]
+    if not len(matches):
+        raise ValueError(f'No header row in the first {max_scan} rows')
+    return int(matches[0])
+
+def time_series_long(path, sheet='Data1', cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """(Date, Item, Value) rows of an ABS time series workbook, one per observed month and series"""
+    table = load_sheet(path, sheet, cache_dir)
+    header = detect_header_row(table)
+    # Series descriptions sit in the first row, e.g. 'Rural goods ;'
+    items = table.iloc[0, 1:].str.replace(r'\s*;\s*$', '', regex=True)
+    data = table.iloc[header + 1:].set_axis(['Date', *items], axis=1)
+    data = data[data['Date'].notna()]
+    long = data.melt(id_vars='Date', var_name='Item', value_name='Value').dropna(subset=['Value'])
+    import pandas as pd
+    long['Value'] = pd.to_numeric(long['Value'])
+    return long.reset_index(drop=True)
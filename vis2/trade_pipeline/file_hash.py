@@ -0,0 +1,14 @@
+"""Content hashes of the files the pipeline caches and rebuilds on.
+
+Standard library only, so the modules keying on a file's contents load
+neither NumPy nor pandas to do it.
+"""
+import hashlib
+
+def file_sha256(path):
+    """Hex SHA-256 of a file's contents, read 1 MiB at a time"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
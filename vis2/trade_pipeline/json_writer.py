@@ -0,0 +1,142 @@
+"""Streaming, compact JSON output for the data files the site serves.
+
+Values are encoded incrementally with compact separators and written through
+a small buffer, so a writer never holds the whole encoded file; given a
+generator of records, it never holds the records either. Every file is
+written to a temporary sibling and renamed into place, optionally together
+with precompressed .gz and .br siblings for static hosting (.br needs the
+brotli package).
+"""
+import gzip
+import json
+import os
+
+# Decimals kept for lon/lat degrees (about 10 m) and for $B trade values
+COORD_PRECISION = 4
+VALUE_PRECISION = 2
+COMPRESSIONS = ('gz', 'br')
+# Encoded text handed to the file and compressors at a time
+BUFFER_SIZE = 1 << 16
+
+_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+def round_coords(coords, precision=COORD_PRECISION):
+    """Copy of a (nested) list of positions with every number rounded; None keeps them as they are"""
+    if precision is None:
+        return coords
+    if coords and isinstance(coords[0], (list, tuple)):
+        return [round_coords(c, precision) for c in coords]
+    return [round(float(v), precision) for v in coords]
+
+def round_value(value, precision=VALUE_PRECISION):
+    return value if precision is None or value is None else round(float(value), precision)
+
+def compressed_paths(path, compress=()):
+    return [f'{path}.{ext}' for ext in compress]
+
+def check_compress(compress):
+    """Raise ValueError/ImportError early for an unknown or unavailable compression"""
+    for ext in compress:
+        if ext not in COMPRESSIONS:
+            raise ValueError(f'Unknown compression {ext!r}; use one of {", ".join(COMPRESSIONS)}')
+        if ext == 'br':
+            try:
+                import brotli  # noqa: F401
+            except ImportError:
+                raise ImportError('.br output needs the brotli package (pip install brotli)') from None
+
+class _GzipSink:
+    def __init__(self, path):
+        # No name or timestamp in the header, so identical content gives identical bytes
+        self.raw = open(path, 'wb')
+        self.f = gzip.GzipFile(filename='', mode='wb', fileobj=self.raw, compresslevel=9, mtime=0)
+
+    def write(self, data):
+        self.f.write(data)
+
+    def close(self):
+        self.f.close()
+        self.raw.close()
+
+class _BrotliSink:
+    def __init__(self, path):
+        import brotli
+        self.f = open(path, 'wb')
+        self.compressor = brotli.Compressor(quality=11)
+
+    def write(self, data):
+        self.f.write(self.compressor.process(data))
+
+    def close(self):
+        self.f.write(self.compressor.finish())
+        self.f.close()
+
+class _FileSink:
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+
+    def write(self, data):
+        self.f.write(data)
+
+    def close(self):
+        self.f.close()
+
+_SINKS = {'gz': _GzipSink, 'br': _BrotliSink}
+
+def write_chunks(chunks, path, compress=()):
+    """Write an iterable of str chunks to path and its compressed siblings, each replaced atomically"""
+    check_compress(compress)
+    paths = [path, *compressed_paths(path, compress)]
+    sinks = []
+    try:
+        sinks.append(_FileSink(path + '.tmp'))
+        for ext in compress:
+            sinks.append(_SINKS[ext](f'{path}.{ext}.tmp'))
+        buffer, size = [], 0
+        for chunk in chunks:
+            buffer.append(chunk); size += len(chunk)
+            if size >= BUFFER_SIZE:
+                data = ''.join(buffer).encode('utf-8')
+                for sink in sinks:
+                    sink.write(data)
+                buffer, size = [], 0
+        data = ''.join(buffer).encode('utf-8')
+        for sink in sinks:
+            sink.write(data)
+    except BaseException:
+        for sink in sinks:
+            sink.close()
+        for p in paths:
+            if os.path.exists(p + '.tmp'):
+                os.remove(p + '.tmp')
+        raise
+    for sink in sinks:
+        sink.close()
+    for p in paths:
+        os.replace(p + '.tmp', p)
+    # A sibling left from an earlier run would be served with stale content
+    for p in compressed_paths(path, [ext for ext in COMPRESSIONS if ext not in compress]):
+        if os.path.exists(p):
+            os.remove(p)
+
+def encode_json(obj):
+    """obj as compact JSON text, for writers that generate their own chunks"""
+    return _encoder.encode(obj)
+
+def write_json(obj, path, compress=()):
+    """obj as compact JSON"""
+    write_chunks(_encoder.iterencode(obj), path, compress)
+
+def _record_chunks(records, head, tail):
+    yield head
+    for i, record in enumerate(records):
+        # One record per line keeps the files diffable at almost no cost
+        yield ('\n' if i == 0 else ',\n') + _encoder.encode(record)
+    yield '\n' + tail + '\n'
+
+def write_json_records(records, path, compress=(), head='[', tail=']'):
+    """A JSON array of records, pulled from the iterable one at a time.
+
+    head and tail wrap the array, e.g. to stream the features of a FeatureCollection.
+    """
+    write_chunks(_record_chunks(records, head, tail), path, compress)
@@ -0,0 +1,661 @@
+"""Curve the straight flow lines into great-circle arcs and clip them to the map.
+
+flow_arcs samples one arc per flow (cached by endpoints and curve parameters),
+clip_arcs cuts the arcs to the basemap's extended bbox and write_flow_runs
+serializes the clipped runs as segments, GeoJSON or TopoJSON. main() runs
+them for both flow types from data/straight_flow_lines_*.json.
+"""
+import json
+import logging
+import math
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from .arc_cache import ArcCache, arc_key, DEFAULT_CACHE_PATH
+from .json_writer import (COORD_PRECISION, VALUE_PRECISION, compressed_paths, encode_json, round_coords,
+                          round_value, write_chunks, write_json_records)
+from .pipeline_metrics import count, count_bytes, stage
+from .topojson_index import DEFAULT_INDEX_DIR, load_topo_index
+
+log = logging.getLogger(__name__)
+
+def to_rad(d): return d * math.pi / 180.0
+def to_deg(r): return r * 180.0 / math.pi
+
+def ll_to_vec(lon: float, lat: float):
+    lon_r, lat_r = to_rad(lon), to_rad(lat)
+    x = math.cos(lat_r) * math.cos(lon_r)
+    y = math.cos(lat_r) * math.sin(lon_r)
+    z = math.sin(lat_r)
+    return np.array([x, y, z], dtype=float)
+
+def _lon_norm(lon):
+    lon = np.asarray(lon, dtype=float)
+    lon = np.where(lon > 180, lon - 360*np.ceil((lon - 180)/360), lon)
+    return np.where(lon < -180, lon + 360*np.ceil((-180 - lon)/360), lon)
+
+def _wrap180(d):
+    # Smallest equivalent longitude difference, in [-180, 180)
+    return (d + 180.0) % 360.0 - 180.0
+
+def _ll_to_vecs(lon, lat):
+    lon_r, lat_r = np.radians(lon), np.radians(lat)
+    cos_lat = np.cos(lat_r)
+    return np.stack([cos_lat*np.cos(lon_r), cos_lat*np.sin(lon_r), np.sin(lat_r)], axis=-1)
+
+def _unit(v):
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+def _slerp_batch(a, b, t):
+    # Spherical linear interpolation; a/b are (..., 3) arrays and t broadcasts against a[..., 0]
+    a = _unit(a); b = _unit(b)
+    dot = np.clip(np.einsum('...i,...i->...', a, b), -1.0, 1.0)
+    omega = np.arccos(dot)
+    degenerate = omega < 1e-12
+    so = np.where(degenerate, 1.0, np.sin(omega))
+    wa = np.where(degenerate, 1.0, np.sin((1 - t)*omega)/so)
+    wb = np.where(degenerate, 0.0, np.sin(t*omega)/so)
+    return wa[..., None]*a + wb[..., None]*b
+
+def _curve_normals(a, b):
+    nrm = np.cross(a, b)
+    length = np.linalg.norm(nrm, axis=-1, keepdims=True)
+    nrm = np.where(length < 1e-12, np.array([0, 0, 1.0]), nrm)
+    return _unit(nrm)
+
+# Arc routing: 'map' keeps flows on the lon/lat map, which is cut at ±180°, by sending flows whose
+# shortest path crosses the date line the other way round; 'short' always takes the shorter
+# great-circle direction, for projections that split lines at the antimeridian themselves
+ROUTES = ('map', 'short')
+
+# Longest on-map way round (degrees) taken instead of a date-line crossing; past this the
+# detour dwarfs the short hop, and the spherical curve through the waypoint starts to fold
+MAX_DETOUR_SPAN = 270.0
+
+def arc_controls(lon1, lat1, lon2, lat2, height, direction, route='map'):
+    """Bezier control vectors for a batch of arcs.
+
+    Returns (a, c, b, lon1_norm, crosses) where a/c/b are (N, 3) unit vectors
+    and crosses flags the flows routed the on-map way round (route='map') or
+    across the date line (route='short').
+    """
+    lon1 = _lon_norm(lon1); lon2 = _lon_norm(lon2)
+    lat1 = np.asarray(lat1, dtype=float); lat2 = np.asarray(lat2, dtype=float)
+    height = np.asarray(height, dtype=float); direction = np.asarray(direction, dtype=float)
+
+    # A longitude span over 180° means the shortest path crosses ±180°
+    span = np.abs(lon2 - lon1)
+    detour = (span > 180) & (span <= MAX_DETOUR_SPAN) if route == 'map' else np.zeros(span.shape, dtype=bool)
+
+    a = _ll_to_vecs(lon1, lat1)
+    b = _ll_to_vecs(lon2, lat2)
+    nrm = _curve_normals(a, b)
+
+    # Direct arcs: bulge the great-circle midpoint sideways
+    mid = _slerp_batch(a, b, 0.5)
+    c = _unit(mid + (direction*height)[:, None]*nrm)
+
+    # On-map detours: steer through a waypoint halfway along the longitude span
+    # that stays on the map. Each half spans at most MAX_DETOUR_SPAN/2 < 180°, so both
+    # halves of the curve take the short way and cannot flip back across the date line.
+    w = _ll_to_vecs((lon1 + lon2)/2.0, (lat1 + lat2)/2.0)
+    c_way = _unit(w + (direction*height*0.5)[:, None]*nrm)
+    c = np.where(detour[:, None], c_way, c)
+    return a, c, b, lon1, detour if route == 'map' else span > 180
+
+def bezier_vecs(a, c, b, t):
+    """Unit vectors on spherical quadratic Beziers; t broadcasts against the leading axes of a."""
+    t = np.asarray(t, dtype=float)
+    p0 = _slerp_batch(a, c, t)
+    p1 = _slerp_batch(c, b, t)
+    return _unit(_slerp_batch(p0, p1, t))
+
+def _vecs_to_lonlat(p):
+    lon = np.degrees(np.arctan2(p[..., 1], p[..., 0]))
+    lat = np.degrees(np.arcsin(np.clip(p[..., 2], -1.0, 1.0)))
+    return lon, lat
+
+def bezier_lonlat(a, c, b, t):
+    """Evaluate spherical quadratic Beziers; t broadcasts against the leading axes of a."""
+    return _vecs_to_lonlat(bezier_vecs(a, c, b, t))
+
+def unwrap_lons(lon, lon_start, crosses):
+    """Make each row of sampled longitudes continuous (no ±360 jumps).
+
+    Rows flagged by crosses are also made continuous with their normalized origin longitude.
+    """
+    first = np.where(crosses, lon_start + _wrap180(lon[:, 0] - lon_start), lon[:, 0])
+    steps = _wrap180(np.diff(lon, axis=1))
+    return np.concatenate([first[:, None], first[:, None] + np.cumsum(steps, axis=1)], axis=1)
+
+def curved_arc_points_batch(lon1, lat1, lon2, lat2, height=0.15, direction=1, n=24, route='map'):
+    """Vectorized curved_arc_points for N flows at once.
+
+    All arguments broadcast to shape (N,). Returns an (N, n+1, 2) array of lon/lat.
+    """
+    lon1, lat1, lon2, lat2, height, direction = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(x, dtype=float)) for x in (lon1, lat1, lon2, lat2, height, direction)))
+    a, c, b, lon_start, crosses = arc_controls(lon1, lat1, lon2, lat2, height, direction, route)
+    t = np.arange(n + 1) / n
+    lon, lat = bezier_lonlat(a[:, None, :], c[:, None, :], b[:, None, :], t[None, :])
+    lon = unwrap_lons(lon, lon_start, crosses)
+    return np.stack([lon, lat], axis=-1)
+
+# Flow map width in the spec, used to turn pixel tolerances into degrees
+MAP_WIDTH = 1000
+
+def pixel_tolerance(pixels, width=MAP_WIDTH):
+    """Planar tolerance in degrees for an error of `pixels` on a map `width` pixels wide."""
+    return pixels * 360.0 / width
+
+def _midpoint_error(p0, p1, pm, metric):
+    if metric == 'planar':
+        # Distance in lon/lat degrees from the straight line between the projected ends
+        (lon0, lat0), (lon1, lat1), (lonm, latm) = (_vecs_to_lonlat(p) for p in (p0, p1, pm))
+        mid_lon = lon0 + _wrap180(lon1 - lon0)/2
+        return np.hypot(_wrap180(lonm - mid_lon), latm - (lat0 + lat1)/2)
+    chord_mid = p0 + p1
+    norm = np.linalg.norm(chord_mid, axis=-1)
+    cos_err = np.einsum('ij,ij->i', pm, chord_mid/np.maximum(norm, 1e-12)[:, None])
+    # Pieces spanning (nearly) antipodal ends have no defined chord; always split those
+    return np.where(norm > 1e-9, np.degrees(np.arccos(np.clip(cos_err, -1.0, 1.0))), np.inf)
+
+def adaptive_arc_params(a, c, b, tolerance=0.1, min_segments=2, max_depth=12, metric='angular'):
+    """Bezier parameters per arc, subdivided until each piece is within tolerance.
+
+    A piece [t0, t1] is accepted when the curve's midpoint lies within
+    tolerance degrees of the line drawn between its ends: the great circle
+    d3 draws for geoshape lines (metric='angular'), or the straight lon/lat
+    line of a rule mark (metric='planar'). Returns (arc_idx, t) sorted by arc
+    then t, with each arc's t running from 0 to 1.
+    """
+    n_arcs = len(a)
+    base = np.arange(min_segments + 1) / min_segments
+    idx = np.repeat(np.arange(n_arcs), min_segments)
+    t0 = np.tile(base[:-1], n_arcs); t1 = np.tile(base[1:], n_arcs)
+    done_idx, done_t0 = [idx[:0]], [t0[:0]]
+    for depth in range(max_depth + 1):
+        if not len(idx):
+            break
+        ai, ci, bi = a[idx], c[idx], b[idx]
+        p0 = bezier_vecs(ai, ci, bi, t0)
+        p1 = bezier_vecs(ai, ci, bi, t1)
+        pm = bezier_vecs(ai, ci, bi, (t0 + t1)/2)
+        split = (_midpoint_error(p0, p1, pm, metric) > tolerance) & (depth < max_depth)
+        done_idx.append(idx[~split]); done_t0.append(t0[~split])
+        mid = (t0[split] + t1[split])/2
+        idx = np.concatenate([idx[split], idx[split]])
+        t0, t1 = np.concatenate([t0[split], mid]), np.concatenate([mid, t1[split]])
+    # Every accepted piece contributes its start; each arc also ends at t=1
+    arc_idx = np.concatenate(done_idx + [np.arange(n_arcs)])
+    t = np.concatenate(done_t0 + [np.ones(n_arcs)])
+    order = np.lexsort((t, arc_idx))
+    return arc_idx[order], t[order]
+
+def unwrap_lons_ragged(lon, offsets, lon_start, crosses):
+    """unwrap_lons for arcs of different lengths stored back to back."""
+    starts = offsets[:-1]
+    first = np.where(crosses, lon_start + _wrap180(lon[starts] - lon_start), lon[starts])
+    steps = np.concatenate([[0.0], _wrap180(np.diff(lon))])
+    # Restart the running sum at every arc start
+    steps[starts] = first
+    csum = np.cumsum(steps)
+    before = np.concatenate([[0.0], csum[starts[1:] - 1]])
+    return csum - np.repeat(before, np.diff(offsets))
+
+def adaptive_arc_points_batch(lon1, lat1, lon2, lat2, height=0.15, direction=1,
+                              tolerance=0.1, min_segments=2, max_depth=12, metric='angular', route='map'):
+    """Like curved_arc_points_batch, but each arc gets only the samples it needs.
+
+    Returns (coords, offsets): arc i is coords[offsets[i]:offsets[i+1]].
+    """
+    lon1, lat1, lon2, lat2, height, direction = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(x, dtype=float)) for x in (lon1, lat1, lon2, lat2, height, direction)))
+    a, c, b, lon_start, crosses = arc_controls(lon1, lat1, lon2, lat2, height, direction, route)
+    arc_idx, t = adaptive_arc_params(a, c, b, tolerance, min_segments, max_depth, metric)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(arc_idx, minlength=len(a)))])
+    lon, lat = bezier_lonlat(a[arc_idx], c[arc_idx], b[arc_idx], t)
+    lon = unwrap_lons_ragged(lon, offsets, lon_start, crosses)
+    return np.stack([lon, lat], axis=-1), offsets
+
+def adaptive_arc_lod_tiers(lon1, lat1, lon2, lat2, height=0.15, direction=1,
+                           tolerances=(1.0, 0.25, 0.05), **kwargs):
+    """adaptive_arc_points_batch at several tolerances: {tolerance: (coords, offsets)}."""
+    return {tol: adaptive_arc_points_batch(lon1, lat1, lon2, lat2, height, direction,
+                                           tolerance=tol, **kwargs)
+            for tol in tolerances}
+
+def curved_arc_points(lon1, lat1, lon2, lat2, height=0.15, direction=1, n=24):
+    pts = curved_arc_points_batch(lon1, lat1, lon2, lat2, height, direction, n)[0]
+    return [(float(x), float(y)) for x, y in pts]
+
+def topo_bbox(path, cache_dir=DEFAULT_INDEX_DIR):
+    """Map bbox of a TopoJSON file from its cached index, parsed only when the file changed (always without cache_dir)"""
+    minx, miny, maxx, maxy = load_topo_index(path, cache_dir)['bbox']
+    return (float(minx), float(miny), float(maxx), float(maxy))
+
+def clip_polylines(coords, offsets, bbox):
+    """Liang-Barsky clip of many polylines against bbox in one vectorized pass.
+
+    coords is an (M, 2) array of all polylines back to back and offsets an
+    (L + 1,) array so polyline i is coords[offsets[i]:offsets[i+1]]. A run is
+    split wherever a segment leaves the box. Returns (out_coords, run_offsets,
+    run_owner): run j is out_coords[run_offsets[j]:run_offsets[j+1]] and came
+    from polyline run_owner[j].
+    """
+    coords = np.asarray(coords, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    xmin, ymin, xmax, ymax = bbox
+    line_of_point = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    # Segments join consecutive points of the same polyline
+    seg = np.flatnonzero(line_of_point[:-1] == line_of_point[1:]) if len(coords) > 1 else np.zeros(0, np.int64)
+    p0 = coords[seg]; p1 = coords[seg + 1]
+    d = p1 - p0
+
+    p = np.stack([-d[:, 0], d[:, 0], -d[:, 1], d[:, 1]], axis=1)
+    q = np.stack([p0[:, 0] - xmin, xmax - p0[:, 0], p0[:, 1] - ymin, ymax - p0[:, 1]], axis=1)
+    parallel = p == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = q / np.where(parallel, 1.0, p)
+    t0 = np.max(np.where(p < 0, r, 0.0), axis=1)
+    t1 = np.min(np.where(p > 0, r, 1.0), axis=1)
+    visible = (t0 <= t1) & ~(parallel & (q < 0)).any(axis=1)
+
+    # Keep unclipped endpoints bit-exact so runs join on identical points
+    a2 = np.where((t0 == 0)[:, None], p0, p0 + t0[:, None]*d)
+    b2 = np.where((t1 == 1)[:, None], p1, p0 + t1[:, None]*d)
+    end_inside = ((p1[:, 0] >= xmin) & (p1[:, 0] <= xmax) &
+                  (p1[:, 1] >= ymin) & (p1[:, 1] <= ymax))
+
+    # A visible segment continues the previous run when that segment was visible,
+    # on the same polyline and ended inside the box
+    cont = np.zeros(len(seg), dtype=bool)
+    if len(seg) > 1:
+        cont[1:] = (visible[1:] & visible[:-1] & end_inside[:-1] &
+                    (line_of_point[seg[1:]] == line_of_point[seg[:-1]]) & (seg[1:] == seg[:-1] + 1))
+    start = visible & ~cont
+
+    # Emit [a2, b2] for run starts and just b2 for continuations, in segment order
+    pts = np.stack([a2, b2], axis=1).reshape(-1, 2)
+    emit = np.stack([start, visible], axis=1).reshape(-1)
+    out_coords = pts[emit]
+    points_per_seg = start.astype(np.int64) + visible
+    run_id = np.cumsum(start) - 1
+    run_lengths = np.bincount(run_id[visible], weights=points_per_seg[visible],
+                              minlength=int(start.sum())).astype(np.int64)
+    run_offsets = np.concatenate([[0], np.cumsum(run_lengths)])
+    run_owner = line_of_point[seg[start]]
+    return out_coords, run_offsets, run_owner
+
+# Arcs per task when sampling or clipping is spread over a process pool
+CHUNK_SIZE = 2000
+
+def map_chunks(fn, chunks, workers=None):
+    """[fn(chunk) for chunk in chunks], in order, on a pool of `workers` processes when that is more than one."""
+    if not workers or workers <= 1 or len(chunks) <= 1:
+        return [fn(chunk) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        return list(pool.map(fn, chunks))
+
+def _clip_chunk(job):
+    arcs, bbox = job
+    return _clip_batch(arcs, bbox)
+
+def clip_arcs(arcs, bbox, workers=None, chunk_size=CHUNK_SIZE):
+    """Clip a batch of arcs (an (N, n+1, 2) array or a list of (k, 2) arrays); returns the runs of each arc."""
+    if not len(arcs):
+        return []
+    if workers and workers > 1 and len(arcs) > chunk_size:
+        jobs = [(arcs[i:i + chunk_size], bbox) for i in range(0, len(arcs), chunk_size)]
+        clipped = [runs for chunk in map_chunks(_clip_chunk, jobs, workers) for runs in chunk]
+    else:
+        clipped = _clip_batch(arcs, bbox)
+    count('runs_kept', sum(len(runs) for runs in clipped))
+    count('arcs_split', sum(len(runs) > 1 for runs in clipped))
+    count('arcs_dropped', sum(not runs for runs in clipped))
+    return clipped
+
+def _clip_batch(arcs, bbox):
+    n_flows = len(arcs)
+    lengths = [len(arc) for arc in arcs]
+    coords, run_offsets, run_owner = clip_polylines(np.concatenate([np.asarray(arc, dtype=float) for arc in arcs]),
+                                                    np.concatenate([[0], np.cumsum(lengths)]), bbox)
+    coords = coords.tolist()
+    runs = [[] for _ in range(n_flows)]
+    for j, owner in enumerate(run_owner.tolist()):
+        runs[owner].append([tuple(pt) for pt in coords[run_offsets[j]:run_offsets[j+1]]])
+    return runs
+
+def split_and_clip_polyline(points, bbox):
+    if len(points) < 2: return []
+    coords, run_offsets, _ = clip_polylines(points, [0, len(points)], bbox)
+    coords = coords.tolist()
+    return [[tuple(pt) for pt in coords[run_offsets[j]:run_offsets[j+1]]]
+            for j in range(len(run_offsets) - 1)]
+
+def pair_direction(lon1, lat1, lon2, lat2):
+    """Curve direction (1 or -1) from a hash of the unordered endpoint pair"""
+    ends = sorted([(round(lon1, 4), round(lat1, 4)), (round(lon2, 4), round(lat2, 4))])
+    return 1 if zlib.crc32(repr(ends).encode('ascii')) % 2 == 0 else -1
+
+def assign_curve_params(flows):
+    """Curve height/direction of every flow, as a pure function of its origin-destination pair.
+
+    Height grows with the great-circle distance (relative to half the globe).
+    Direction comes from a hash of the unordered endpoint pair, so both
+    directions of a pair share it and, because reversing the endpoints flips
+    the curve normal, exports and imports bulge on opposite sides.
+    """
+    if not flows:
+        return {}
+    lon1, lat1, lon2, lat2 = np.array([[f['origin_lon'], f['origin_lat'], f['dest_lon'], f['dest_lat']]
+                                       for f in flows], dtype=float).T
+    dot = np.einsum('ij,ij->i', _ll_to_vecs(lon1, lat1), _ll_to_vecs(lon2, lat2))
+    heights = np.minimum(0.1 + 0.2*np.sqrt(np.arccos(np.clip(dot, -1.0, 1.0))/np.pi), 0.32)
+    return {i: {'height': float(heights[i]),
+                'direction': pair_direction(f['origin_lon'], f['origin_lat'], f['dest_lon'], f['dest_lat'])}
+            for i, f in enumerate(flows)}
+
+def _sample_chunk(job):
+    cols, n_points, tolerance, metric, route = job
+    if tolerance is None:
+        return list(curved_arc_points_batch(*cols, n=n_points, route=route))
+    coords, offsets = adaptive_arc_points_batch(*cols, tolerance=tolerance, metric=metric, route=route)
+    return np.split(coords, offsets[1:-1])
+
+def sample_arcs(cols, n_points=24, tolerance=None, metric='angular', workers=None, chunk_size=CHUNK_SIZE,
+                route='map'):
+    """Sampled arcs for (6, N) columns of lon1, lat1, lon2, lat2, height, direction, in input order.
+
+    Every arc depends only on its own column, so splitting the batch into
+    chunks across worker processes gives the same arcs as one batch.
+    """
+    jobs = [(cols[:, i:i + chunk_size], n_points, tolerance, metric, route)
+            for i in range(0, cols.shape[1], chunk_size)]
+    return [arc for chunk in map_chunks(_sample_chunk, jobs, workers) for arc in chunk]
+
+def flow_arcs(flow_data, n_points=24, cache=None, tolerance=None, metric='angular', workers=None, route='map'):
+    """Sampled arc for every flow, computing each distinct (endpoints, params, sampling) arc once.
+
+    With tolerance (degrees, measured per metric) arcs are sampled adaptively
+    instead of with n_points fixed samples, so their lengths differ. Flows repeated across
+    years share their geometry; with an ArcCache, arcs computed in earlier
+    runs are reused as well. workers > 1 samples the missing arcs on a process pool.
+    route is one of ROUTES.
+    """
+    cache = cache if cache is not None else ArcCache()
+    curve_params = assign_curve_params(flow_data)
+    sampling = (route, n_points if tolerance is None else (metric, float(tolerance)))
+    keys = [arc_key(f['origin_lon'], f['origin_lat'], f['dest_lon'], f['dest_lat'],
+                    curve_params[i]['height'], curve_params[i]['direction'], sampling)
+            for i, f in enumerate(flow_data)]
+    arcs = {k: cache.get(k) for k in dict.fromkeys(keys)}
+    missing = [k for k, arc in arcs.items() if arc is None]
+    count('arcs', len(keys))
+    count('arcs_unique', len(arcs))
+    count('arcs_sampled', len(missing))
+    if missing:
+        cols = np.array([k[:6] for k in missing], dtype=float).T
+        computed = sample_arcs(cols, n_points, tolerance, metric, workers, route=route)
+        for k, arc in zip(missing, computed):
+            cache.put(k, arc)
+            arcs[k] = arc
+    return [arcs[k] for k in keys]
+
+def curve_and_clip_flows(flow_data, bbox, n_points=24, cache=None, tolerance=None, metric='angular',
+                         workers=None, route='map'):
+    """Curve every flow and clip it to bbox; returns one list of runs per flow."""
+    if not flow_data:
+        return []
+    arcs = flow_arcs(flow_data, n_points=n_points, cache=cache, tolerance=tolerance, metric=metric,
+                     workers=workers, route=route)
+    # DON'T unwrap - keep the continuous coordinates from curve generation
+    # The curve function already handles longitude continuity correctly
+    return clip_arcs(arcs, bbox, workers=workers)
+
+def iter_segments(flow_data, runs, precision=None, value_precision=None):
+    """One record per clipped segment, repeating the flow attributes (legacy layout), generated lazily.
+
+    precision and value_precision round coordinates and values to that many decimals.
+    """
+    n = 0
+    for f, inside in zip(flow_data, runs):
+        value = round_value(f.get('value'), value_precision)
+        for seg in inside:
+            seg = round_coords(seg, precision)
+            for i in range(len(seg)-1):
+                yield {
+                    'country': f.get('country'),
+                    'year': f.get('year'),
+                    'value': value,
+                    'origin_lon': seg[i][0],
+                    'origin_lat': seg[i][1],
+                    'dest_lon': seg[i+1][0],
+                    'dest_lat': seg[i+1][1],
+                    'segment': i,
+                    'total_segments': len(seg)-1
+                }
+                n += 1
+    count('segments', n)
+
+def segments_from_runs(flow_data, runs, precision=None, value_precision=None):
+    return list(iter_segments(flow_data, runs, precision, value_precision))
+
+FLOW_PROPERTIES = ('country', 'year', 'value')
+# Named endpoints of many-to-many flows, kept when the flow has them
+PAIR_PROPERTIES = ('origin', 'destination')
+
+def flow_properties(f, value_precision=None):
+    properties = {k: f.get(k) for k in FLOW_PROPERTIES}
+    properties['value'] = round_value(properties['value'], value_precision)
+    properties.update({k: f[k] for k in PAIR_PROPERTIES if k in f})
+    return properties
+
+def iter_features(flow_data, runs, precision=None, value_precision=None):
+    """One GeoJSON Feature per flow: a LineString, or a MultiLineString when clipping splits it.
+
+    Features are generated lazily; precision and value_precision round
+    coordinates and values to that many decimals.
+    """
+    n = 0
+    for f, inside in zip(flow_data, runs):
+        if not inside:
+            continue
+        lines = [round_coords([list(p) for p in seg], precision) for seg in inside]
+        if len(lines) == 1:
+            geometry = {'type': 'LineString', 'coordinates': lines[0]}
+        else:
+            geometry = {'type': 'MultiLineString', 'coordinates': lines}
+        yield {
+            'type': 'Feature',
+            'properties': flow_properties(f, value_precision),
+            'geometry': geometry
+        }
+        n += 1
+    count('features', n)
+
+def features_from_runs(flow_data, runs, precision=None, value_precision=None):
+    return list(iter_features(flow_data, runs, precision, value_precision))
+
+def add_curves_to_flows_with_clipping(flow_data, bbox, n_points=24, cache=None):
+    return segments_from_runs(flow_data, curve_and_clip_flows(flow_data, bbox, n_points, cache))
+
+def add_curves_to_flows_as_features(flow_data, bbox, n_points=24, cache=None):
+    return features_from_runs(flow_data, curve_and_clip_flows(flow_data, bbox, n_points, cache))
+
+def flow_lines(flow_data, runs, value_precision=None):
+    """(properties, lines) of each flow clipping left something of, for topojson_chunks()"""
+    for f, inside in zip(flow_data, runs):
+        if inside:
+            yield flow_properties(f, value_precision), inside
+
+def feature_lines(features):
+    """(properties, lines) of LineString/MultiLineString features, for topojson_chunks()"""
+    for feat in features:
+        geom = feat['geometry']
+        yield feat['properties'], geom['coordinates'] if geom['type'] == 'MultiLineString' else [geom['coordinates']]
+
+def _quantize_arc(line, x0, y0, kx, ky):
+    q = np.rint((np.asarray(line, dtype=float) - (x0, y0)) / (kx, ky)).astype(np.int64)
+    # Drop repeated points that quantize to the same position (keep at least two)
+    keep = np.ones(len(q), dtype=bool)
+    keep[1:] = (q[1:] != q[:-1]).any(axis=1)
+    if keep.sum() < 2:
+        keep[-1] = True
+    q = q[keep]
+    # First position is absolute, the rest are deltas from the previous position
+    return np.diff(q, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).tolist()
+
+def topojson_chunks(entries, object_name='flows', quantization=100000):
+    """Quantized TopoJSON with one delta-encoded arc per line; properties stored once per flow.
+
+    entries() returns a fresh iterable of (properties, lines), one per
+    feature, and is called once per pass (bounding box, geometries, arcs),
+    so the text is generated without holding the topology or more than one
+    feature's arcs.
+    """
+    x0 = y0 = math.inf
+    x1 = y1 = -math.inf
+    for _, lines in entries():
+        for line in lines:
+            a = np.asarray(line, dtype=float)
+            (lx0, ly0), (lx1, ly1) = a.min(axis=0), a.max(axis=0)
+            x0, y0, x1, y1 = min(x0, lx0), min(y0, ly0), max(x1, lx1), max(y1, ly1)
+    if x0 > x1:
+        yield encode_json({'type': 'Topology', 'objects': {object_name: {'type': 'GeometryCollection',
+                                                                          'geometries': []}}, 'arcs': []})
+        return
+    kx = (x1 - x0) / (quantization - 1) or 1.0
+    ky = (y1 - y0) / (quantization - 1) or 1.0
+    transform = {'scale': [float(kx), float(ky)], 'translate': [float(x0), float(y0)]}
+    yield (f'{{"type":"Topology","transform":{encode_json(transform)},"objects":{{{encode_json(object_name)}:'
+           '{"type":"GeometryCollection","geometries":[')
+    arc_idx = n = 0
+    for properties, lines in entries():
+        if len(lines) == 1:
+            geometry = {'type': 'LineString', 'arcs': [arc_idx]}
+        else:
+            geometry = {'type': 'MultiLineString', 'arcs': [[arc_idx + j] for j in range(len(lines))]}
+        arc_idx += len(lines)
+        geometry['properties'] = properties
+        yield (',' if n else '') + encode_json(geometry)
+        n += 1
+    count('features', n)
+    yield ']}},"arcs":['
+    i = 0
+    for _, lines in entries():
+        for line in lines:
+            yield (',' if i else '') + encode_json(_quantize_arc(line, x0, y0, kx, ky))
+            i += 1
+    yield ']}'
+
+def write_topojson(entries, path, compress=(), object_name='flows', quantization=100000):
+    """Stream topojson_chunks(entries) to path, plus a compressed sibling per extension in compress"""
+    write_chunks(topojson_chunks(entries, object_name, quantization), path, compress)
+
+TOPO_PATH = 'specs/ne_110m_admin_0_countries.topojson'
+STRAIGHT_FLOW_LINES = 'data/straight_flow_lines_{}.json'
+FLOW_OUTPUTS = {
+    'segments': 'data/NEW_flow_lines_{}.json',
+    'geojson': 'data/flow_features_{}.geojson',
+    'topojson': 'data/flow_features_{}.topojson',
+}
+
+def flow_bbox(topo_path=TOPO_PATH, route='map', cache_dir=DEFAULT_INDEX_DIR):
+    """Box the flows are clipped to: the basemap's extent, widened for route='short'"""
+    minx, miny, maxx, maxy = topo_bbox(topo_path, cache_dir)
+    if route == 'short':
+        # Arcs keep continuous longitudes from their origin, so one crossing the date line
+        # runs up to 180° past the map's edge; the projection splits it there
+        return (minx - 180.0, miny, maxx + 180.0, maxy)
+    return (minx, miny, maxx, maxy)
+
+def flows_output(flow_data, runs, fmt='segments', precision=COORD_PRECISION, value_precision=VALUE_PRECISION):
+    """Output of one format; segment records, GeoJSON features and TopoJSON are generated as they are written."""
+    if fmt == 'segments':
+        return iter_segments(flow_data, runs, precision, value_precision)
+    if fmt == 'geojson':
+        return {'type': 'FeatureCollection', 'features': iter_features(flow_data, runs, precision, value_precision)}
+    # TopoJSON quantizes the coordinates itself, and is generated in passes over the runs
+    return lambda: flow_lines(flow_data, runs, value_precision)
+
+def write_flows_output(out, out_path, fmt='segments', compress=()):
+    """Stream flows_output() to out_path, plus a compressed sibling per extension in compress"""
+    if fmt == 'segments':
+        write_json_records(out, out_path, compress)
+    elif fmt == 'geojson':
+        write_json_records(out['features'], out_path, compress, head='{"type":"FeatureCollection","features":[',
+                           tail=']}')
+    else:
+        write_topojson(out, out_path, compress)
+
+def write_flow_runs(flow_data, runs, out_path, fmt='segments', precision=COORD_PRECISION,
+                    value_precision=VALUE_PRECISION, compress=()):
+    """Serialize clipped runs of flow_data to out_path in fmt"""
+    write_flows_output(flows_output(flow_data, runs, fmt, precision, value_precision), out_path, fmt, compress)
+
+def default_metric(fmt):
+    # Per-segment records are drawn as straight rules; features as d3 great-circle lines
+    return 'planar' if fmt == 'segments' else 'angular'
+
+def lod_path(path, level):
+    root, ext = os.path.splitext(path)
+    return f'{root}_lod{level}{ext}'
+
+def write_flows(flow_data, bbox, out_path, fmt='segments', n_points=24, cache=None, tolerance=None, workers=None,
+                precision=COORD_PRECISION, value_precision=VALUE_PRECISION, compress=(), route='map'):
+    name = os.path.splitext(os.path.basename(out_path))[0]
+    with stage(f'{name}/geometry'):
+        arcs = flow_arcs(flow_data, n_points=n_points, cache=cache, tolerance=tolerance,
+                         metric=default_metric(fmt), workers=workers, route=route)
+    with stage(f'{name}/clip'):
+        runs = clip_arcs(arcs, bbox, workers=workers)
+    with stage(f'{name}/serialize'):
+        write_flow_runs(flow_data, runs, out_path, fmt, precision, value_precision, compress)
+        count_bytes([out_path])
+        count_bytes(compressed_paths(out_path, compress), 'bytes_compressed')
+
+def main(fmt='segments', cache_path=DEFAULT_CACHE_PATH, tolerance=None, lod=None, workers=None,
+         precision=COORD_PRECISION, value_precision=VALUE_PRECISION, compress=(), topo_path=TOPO_PATH,
+         input_pattern=STRAIGHT_FLOW_LINES, output_pattern=None, route='map'):
+    """Curve and clip both flow types; the patterns take the flow type, output defaults to FLOW_OUTPUTS[fmt].
+
+    Returns 1 if an input is missing, else 0.
+    """
+    flow_exports = input_pattern.format('exports')
+    flow_imports = input_pattern.format('imports')
+    if not os.path.exists(topo_path):
+        log.error(f'Missing TopoJSON: {topo_path}'); return 1
+    if not os.path.exists(flow_exports) or not os.path.exists(flow_imports):
+        log.error('Missing straight flow JSONs, run python -m trade_pipeline convert first.'); return 1
+    log.info(f'Original map bbox: {topo_bbox(topo_path)}')
+    flows_bbox = flow_bbox(topo_path, route)
+    log.info(f'Bbox for {route} flows: {flows_bbox}')
+    
+    with open(flow_exports, 'r', encoding='utf-8') as f: exports = json.load(f)
+    with open(flow_imports, 'r', encoding='utf-8') as f: imports = json.load(f)
+    # Outputs never overwrite the straight inputs, so re-running is safe
+    output_pattern = output_pattern or FLOW_OUTPUTS[fmt]
+    out_exports = output_pattern.format('exports')
+    out_imports = output_pattern.format('imports')
+    cache = ArcCache(cache_path)
+    if lod:
+        # One output per level of detail, coarsest tolerance first
+        for level, tol in enumerate(sorted(lod, reverse=True)):
+            for flows, out in ((exports, out_exports), (imports, out_imports)):
+                write_flows(flows, flows_bbox, lod_path(out, level), fmt=fmt, cache=cache, tolerance=tol,
+                            workers=workers, precision=precision, value_precision=value_precision, compress=compress,
+                            route=route)
+            log.info(f'Wrote LOD {level} (tolerance {tol}°): {lod_path(out_exports, level)} and {lod_path(out_imports, level)}')
+    else:
+        for flows, out in ((exports, out_exports), (imports, out_imports)):
+            write_flows(flows, flows_bbox, out, fmt=fmt, n_points=24, cache=cache, tolerance=tolerance,
+                        workers=workers, precision=precision, value_precision=value_precision, compress=compress,
+                        route=route)
+        log.info(f'Wrote: {out_exports} and {out_imports}')
+    cache.save()
+    log.info(f'Arc cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} arcs stored')
+    return 0
+
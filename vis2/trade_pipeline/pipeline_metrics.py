@@ -0,0 +1,140 @@
+"""Stage-level metrics for pipeline runs.
+
+A PipelineMetrics run records, for every stage(name) block, its wall time,
+CPU time (worker processes included), peak traced memory and any counters the
+code inside it adds with count(). On exit it writes them as a JSON report and,
+if asked, dumps the cProfile stats of the heaviest (longest) stage. Outside a
+run, stage() and count() do nothing, so instrumented code costs nothing when
+nobody is measuring.
+
+Memory is traced with tracemalloc, which slows allocation-heavy stages, so
+compare wall times between reports rather than against untraced runs.
+"""
+import contextlib
+import cProfile
+import datetime
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+METRICS_VERSION = 1
+
+# The run in progress, if any
+_active = None
+
+def _cpu_seconds():
+    t = os.times()
+    # children_* only grow once worker processes are reaped, i.e. when a pool shuts down
+    return t.user + t.system + t.children_user + t.children_system
+
+class PipelineMetrics:
+    """Context manager collecting stage metrics; the report is written on exit."""
+
+    def __init__(self, report_path=None, profile_path=None, trace_memory=True):
+        self.report_path = report_path
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.stages = []
+        # Counters added outside any stage
+        self.counters = {}
+        self._current = None
+        self._heaviest = None
+        self._started = None
+
+    def __enter__(self):
+        global _active
+        self._previous, _active = _active, self
+        self._started = (datetime.datetime.now().isoformat(timespec='seconds'), time.perf_counter(), _cpu_seconds())
+        self._tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous
+        if self._tracing:
+            tracemalloc.stop()
+        if self.report_path:
+            self.write_report(self.report_path)
+        if self.profile_path and self._heaviest:
+            self._heaviest[2].dump_stats(self.profile_path)
+            log.info(f'Profile of {self._heaviest[1]} -> {self.profile_path}')
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure the block as one stage; a stage opened inside another is timed but not profiled"""
+        record = {'name': name, 'counters': {}}
+        outer, self._current = self._current, record
+        profiler = cProfile.Profile() if self.profile_path and outer is None else None
+        if tracemalloc.is_tracing() and outer is None:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall_s'] = round(time.perf_counter() - wall, 6)
+            record['cpu_s'] = round(_cpu_seconds() - cpu, 6)
+            if tracemalloc.is_tracing() and outer is None:
+                record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            self._current = outer
+            self.stages.append(record)
+            if profiler and (self._heaviest is None or record['wall_s'] > self._heaviest[0]):
+                self._heaviest = (record['wall_s'], name, profiler)
+
+    def count(self, name, n=1):
+        counters = self._current['counters'] if self._current is not None else self.counters
+        counters[name] = counters.get(name, 0) + n
+
+    def report(self):
+        started, wall, cpu = self._started
+        totals = {}
+        for record in self.stages:
+            for name, n in record['counters'].items():
+                totals[name] = totals.get(name, 0) + n
+        for name, n in self.counters.items():
+            totals[name] = totals.get(name, 0) + n
+        return {
+            'version': METRICS_VERSION,
+            'started': started,
+            'wall_s': round(time.perf_counter() - wall, 6),
+            'cpu_s': round(_cpu_seconds() - cpu, 6),
+            'stages': self.stages,
+            'counters': totals,
+            'profiled_stage': self._heaviest[1] if self._heaviest else None,
+        }
+
+    def write_report(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        log.info(f'Metrics: {len(self.stages)} stages -> {path}')
+
+def metrics_run(report_path=None, profile_path=None):
+    """A PipelineMetrics run when a report or profile was asked for, else a no-op context"""
+    if report_path or profile_path:
+        return PipelineMetrics(report_path, profile_path)
+    return contextlib.nullcontext()
+
+def stage(name):
+    """PipelineMetrics.stage() of the active run, or a no-op context"""
+    return _active.stage(name) if _active is not None else contextlib.nullcontext()
+
+def count(name, n=1):
+    """Add n to a counter of the current stage of the active run, if any"""
+    if _active is not None:
+        _active.count(name, int(n))
+
+def count_bytes(paths, name='bytes_written'):
+    """Count the size of the files written to paths"""
+    if _active is not None:
+        _active.count(name, sum(os.path.getsize(p) for p in paths if os.path.exists(p)))
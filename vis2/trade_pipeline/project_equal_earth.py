@@ -0,0 +1,122 @@
+"""Pre-project the flow map geometry into equalEarth screen space.
+
+Applies d3's equalEarth forward formulas with NumPy, fitted to the spec's
+width/height the way Vega-Lite fits the projection to the basemap. The
+projected basemap and flows are drawn with an identity projection (scale 1,
+translate 0), so the browser never re-projects them on a render or signal
+change. The fitted parameters go into the spec's usermeta, which
+flow_map_controller.js uses to invert cursor positions for the hover tooltips.
+"""
+import copy
+
+import numpy as np
+
+from .simplify_basemap import DEFAULT_QUANTIZATION, quantize_arcs
+from .topojson_index import decode_arcs
+
+PROJECTED_SPEC_PATH = 'specs/flow_map_projected.vg.json'
+
+# Polynomial coefficients of the Equal Earth projection (Šavrič, Patterson and Jenny, 2018)
+A1, A2, A3, A4 = 1.340264, -0.081106, 0.000893, 0.003796
+M = np.sqrt(3) / 2
+
+def equal_earth(lon, lat):
+    """Unit-scale equalEarth (x, y) of lon/lat degrees, y pointing north"""
+    lam = np.radians(lon)
+    l = np.arcsin(M * np.sin(np.radians(lat)))
+    l2 = l*l; l6 = l2*l2*l2
+    x = lam * np.cos(l) / (M * (A1 + 3*A2*l2 + l6*(7*A3 + 9*A4*l2)))
+    y = l * (A1 + A2*l2 + l6*(A3 + A4*l2))
+    return x, y
+
+def equal_earth_invert(x, y, iterations=12):
+    """lon/lat degrees of unit-scale equalEarth (x, y), by Newton's method on the latitude polynomial"""
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    l = y.copy()
+    for _ in range(iterations):
+        l2 = l*l; l6 = l2*l2*l2
+        l = l - (l*(A1 + A2*l2 + l6*(A3 + A4*l2)) - y) / (A1 + 3*A2*l2 + l6*(7*A3 + 9*A4*l2))
+    l2 = l*l; l6 = l2*l2*l2
+    lon = M * x * (A1 + 3*A2*l2 + l6*(7*A3 + 9*A4*l2)) / np.cos(l)
+    return np.degrees(lon), np.degrees(np.arcsin(np.clip(np.sin(l) / M, -1.0, 1.0)))
+
+def fit_size(coords, width, height):
+    """{'scale', 'translate'} placing lon/lat coords in a width x height view, as d3's fitSize does"""
+    x, y = equal_earth(coords[:, 0], coords[:, 1])
+    # Screen y grows downwards
+    x0, x1, y0, y1 = x.min(), x.max(), (-y).min(), (-y).max()
+    k = min(width / (x1 - x0), height / (y1 - y0))
+    return {'scale': float(k), 'translate': [float((width - k*(x0 + x1)) / 2), float((height - k*(y0 + y1)) / 2)]}
+
+def project(coords, fit):
+    """(N, 2) pixel positions of lon/lat coords"""
+    x, y = equal_earth(coords[:, 0], coords[:, 1])
+    k = fit['scale']; tx, ty = fit['translate']
+    return np.stack([tx + k*x, ty - k*y], axis=-1)
+
+def split_antimeridian(line):
+    """Pieces of a continuous-longitude line, each with longitudes in [-180, 180].
+
+    Flow arcs keep unwrapped longitudes past ±180°, which d3 would cut at the
+    antimeridian; each crossing ends one piece on one edge of the map and
+    starts the next on the other.
+    """
+    line = np.asarray(line, dtype=float)
+    # 360° band of each point, counted from -180°; band 0 needs no wrapping
+    band = np.floor((line[:, 0] + 180.0) / 360.0)
+    pieces = []
+    start = 0
+    for i in np.flatnonzero(np.diff(band)):
+        p, q = line[i], line[i + 1]
+        edge = 360.0*max(band[i], band[i + 1]) - 180.0
+        crossing = [edge, p[1] + (edge - p[0]) / (q[0] - p[0]) * (q[1] - p[1])]
+        pieces.append((np.vstack([line[start:i + 1], [crossing]]), band[i]))
+        line = line.copy()
+        line[i] = crossing
+        start = i
+    pieces.append((line[start:], band[-1]))
+    return [piece - (360.0*b, 0.0) for piece, b in pieces if len(piece) >= 2]
+
+def project_topology(topo, fit, quantization=DEFAULT_QUANTIZATION):
+    """Copy of a lon/lat topology with its arcs in pixels, re-quantized"""
+    coords, offsets = decode_arcs(topo)
+    pixels = project(coords, fit)
+    transform, arcs = quantize_arcs([pixels[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)],
+                                    quantization)
+    return {**topo, 'transform': transform, 'arcs': arcs}
+
+def project_features(features, fit):
+    """Copies of LineString/MultiLineString features with pixel coordinates, cut at the antimeridian"""
+    out = []
+    for feat in features:
+        geom = feat['geometry']
+        lines = geom['coordinates'] if geom['type'] == 'MultiLineString' else [geom['coordinates']]
+        pieces = [project(piece, fit).tolist() for line in lines for piece in split_antimeridian(line)]
+        if not pieces:
+            continue
+        if len(pieces) == 1:
+            geometry = {'type': 'LineString', 'coordinates': pieces[0]}
+        else:
+            geometry = {'type': 'MultiLineString', 'coordinates': pieces}
+        out.append({**feat, 'geometry': geometry})
+    return out
+
+def projected_spec(spec, fit, urls, named=None):
+    """Copy of the flow map spec drawing pre-projected data with an identity projection.
+
+    urls maps each data url in the spec to its projected counterpart, and
+    named maps named (runtime-filled) data sources to the data to draw instead;
+    the replacement drops the name, so nothing refills them.
+    """
+    spec = copy.deepcopy(spec)
+    # An explicit scale and translate stop Vega-Lite from fitting the projection to the data
+    spec['projection'] = {'type': 'identity', 'scale': 1, 'translate': [0, 0]}
+    spec['usermeta'] = {**spec.get('usermeta', {}), 'equalEarth': fit}
+    named = named or {}
+    for owner in [spec, *spec.get('layer', [])]:
+        data = owner.get('data')
+        if data and data.get('name') in named:
+            owner['data'] = dict(named[data['name']])
+        elif data and data.get('url') in urls:
+            data['url'] = urls[data['url']]
+    return spec
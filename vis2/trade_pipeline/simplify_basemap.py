@@ -0,0 +1,130 @@
+"""Simplified, re-quantized basemap for the flow map.
+
+Simplifies every arc of the Natural Earth TopoJSON once with Visvalingam's
+algorithm, so borders shared by two countries stay shared, keeps only the
+properties the specs read and re-quantizes the result. Run from the vis2
+directory:
+
+    python -m trade_pipeline basemap [--min-area 0.1] [--quantization 10000]
+"""
+import heapq
+import logging
+
+import numpy as np
+
+from .json_writer import write_json
+from .topojson_index import decode_arcs, load_topology
+
+log = logging.getLogger(__name__)
+
+BASEMAP_PATH = 'data/basemap.topojson'
+BASEMAP_OBJECT = 'countries'
+# Feature properties the specs and flow_map_controller.js use
+BASEMAP_PROPERTIES = ('NAME',)
+# Smallest triangle area kept, in square degrees (a pixel of the 1000px-wide map is ~0.13)
+DEFAULT_MIN_AREA = 0.1
+DEFAULT_QUANTIZATION = 10000
+
+def _triangle_area(a, b, c):
+    return abs((b[0] - a[0])*(c[1] - a[1]) - (c[0] - a[0])*(b[1] - a[1])) / 2.0
+
+def visvalingam_keep(points, min_area, min_points=2):
+    """Mask of the points Visvalingam-Whyatt keeps: the ends, and any point whose
+    effective triangle area reaches min_area (or that is needed to keep min_points)."""
+    n = len(points)
+    keep = np.ones(n, dtype=bool)
+    if n <= max(min_points, 2):
+        return keep
+    pts = points.tolist()
+    prev = list(range(-1, n - 1)); nxt = list(range(1, n + 1))
+    areas = [np.inf] + [_triangle_area(pts[i - 1], pts[i], pts[i + 1]) for i in range(1, n - 1)] + [np.inf]
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    remaining = n
+    floor = 0.0
+    while heap and remaining > min_points:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:
+            continue
+        # A point's effective area never drops below that of one removed before it
+        floor = max(floor, area)
+        if floor >= min_area:
+            break
+        keep[i] = False
+        remaining -= 1
+        p, q = prev[i], nxt[i]
+        nxt[p] = q; prev[q] = p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                areas[j] = _triangle_area(pts[prev[j]], pts[j], pts[nxt[j]])
+                heapq.heappush(heap, (areas[j], j))
+    return keep
+
+def _geometries(topo):
+    for obj in topo.get('objects', {}).values():
+        yield from obj.get('geometries', [])
+
+def _rings(geom):
+    if geom['type'] == 'Polygon':
+        return geom['arcs']
+    if geom['type'] == 'MultiPolygon':
+        return [ring for poly in geom['arcs'] for ring in poly]
+    return []
+
+def quantize_arcs(arcs, quantization=DEFAULT_QUANTIZATION):
+    """(transform, delta-encoded arcs) of float (N, 2) arcs on a quantization x quantization grid"""
+    flat = np.concatenate(arcs) if arcs else np.zeros((1, 2))
+    x0, y0 = flat.min(axis=0); x1, y1 = flat.max(axis=0)
+    kx = (x1 - x0) / (quantization - 1) or 1.0
+    ky = (y1 - y0) / (quantization - 1) or 1.0
+    out = []
+    for arc in arcs:
+        q = np.rint((arc - (x0, y0)) / (kx, ky)).astype(np.int64)
+        # Drop points that quantize onto their predecessor, keeping the ends
+        same = np.zeros(len(q), dtype=bool)
+        same[1:-1] = (q[1:-1] == q[:-2]).all(axis=1)
+        q = q[~same]
+        out.append(np.diff(q, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).tolist())
+    return {'scale': [float(kx), float(ky)], 'translate': [float(x0), float(y0)]}, out
+
+def simplify_topology(topo, min_area=DEFAULT_MIN_AREA, quantization=DEFAULT_QUANTIZATION,
+                      properties=BASEMAP_PROPERTIES, object_name=BASEMAP_OBJECT):
+    """Copy of a single-object polygon topology with simplified, re-quantized arcs and trimmed properties."""
+    coords, offsets = decode_arcs(topo)
+    arcs = [coords[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    # A ring keeps at least three corners: the ends of its arcs give one per arc,
+    # so a ring of one arc keeps two interior points and a ring of two arcs one each
+    min_points = [2] * len(arcs)
+    for geom in _geometries(topo):
+        for ring in _rings(geom):
+            if len(ring) <= 2:
+                for a in ring:
+                    i = a if a >= 0 else ~a
+                    min_points[i] = max(min_points[i], 5 - len(ring))
+    simplified = [arc[visvalingam_keep(arc, min_area, k)] for arc, k in zip(arcs, min_points)]
+
+    transform, out_arcs = quantize_arcs(simplified, quantization)
+
+    geometries = []
+    for geom in _geometries(topo):
+        props = geom.get('properties') or {}
+        kept = {'type': geom['type'], 'arcs': geom.get('arcs', [])}
+        kept['properties'] = {k: props[k] for k in properties if k in props}
+        geometries.append(kept)
+    return {
+        'type': 'Topology',
+        'transform': transform,
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': out_arcs,
+    }
+
+def write_basemap(topo, path, compress=()):
+    write_json(topo, path, compress)
+
+def main(topo_path, out_path=BASEMAP_PATH, min_area=DEFAULT_MIN_AREA, quantization=DEFAULT_QUANTIZATION):
+    topo = load_topology(topo_path)
+    out = simplify_topology(topo, min_area, quantization)
+    write_basemap(out, out_path)
+    before = sum(len(a) for a in topo['arcs']); after = sum(len(a) for a in out['arcs'])
+    log.info(f'✓ {out_path}: {after} of {before} arc points kept')
+
@@ -0,0 +1,267 @@
+"""Decoded TopoJSON geometry and the per-file index the pipeline reads from it.
+
+build_index() holds the map bbox and each country's bounds, area and
+centroid; load_topo_index() caches it under the file's content hash, so the
+topology is parsed again only when it changes. build_hit_grid() builds the
+lon/lat grid the flow map's hover tooltips hit-test against.
+"""
+import json
+import os
+
+import numpy as np
+
+from .file_hash import file_sha256
+
+INDEX_VERSION = 2
+HIT_GRID_VERSION = 1
+DEFAULT_INDEX_DIR = '.cache'
+WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+
+# Natural Earth NAME -> the country names used by the flow data
+MAP_NAME_MAPPING = {
+    'United States of America': 'United States',
+}
+
+def load_topology(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def decode_arcs(topo):
+    """Decode every arc in one pass.
+
+    Returns (coords, offsets): an (M, 2) float array of lon/lat for all arcs
+    back to back, and an (n_arcs + 1,) array so arc i is coords[offsets[i]:offsets[i+1]].
+    """
+    arcs = topo.get('arcs', [])
+    lengths = np.fromiter((len(a) for a in arcs), dtype=np.int64, count=len(arcs))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if not len(arcs) or offsets[-1] == 0:
+        return np.zeros((0, 2)), offsets
+    # Arcs may carry extra per-position values; only x/y are needed
+    flat = np.concatenate([np.asarray(a, dtype=float)[:, :2] for a in arcs if len(a)])
+    transform = topo.get('transform')
+    if not transform:
+        return flat, offsets
+    # Delta-decode: cumulative sum over everything, minus the running total at each arc start
+    totals = np.cumsum(flat, axis=0)
+    starts = np.repeat(offsets[:-1], lengths)
+    base = np.vstack([[0.0, 0.0], totals])[starts]
+    quantized = totals - base
+    scale = np.asarray(transform.get('scale', [1, 1]), dtype=float)
+    translate = np.asarray(transform.get('translate', [0, 0]), dtype=float)
+    return quantized * scale + translate, offsets
+
+def ring_coords(ring_arcs, coords, offsets):
+    """Stitch a ring from arc references (~i means arc i reversed)."""
+    parts = []
+    for i, ref in enumerate(ring_arcs):
+        idx = ref if ref >= 0 else ~ref
+        part = coords[offsets[idx]:offsets[idx + 1]]
+        if ref < 0:
+            part = part[::-1]
+        # Consecutive arcs share their joining point
+        parts.append(part if i == 0 else part[1:])
+    return np.concatenate(parts) if parts else np.zeros((0, 2))
+
+def geometry_polygons(geom, coords, offsets):
+    """List of polygons (each a list of rings, exterior first) for a Polygon/MultiPolygon."""
+    if geom.get('type') == 'Polygon':
+        polys = [geom['arcs']]
+    elif geom.get('type') == 'MultiPolygon':
+        polys = geom['arcs']
+    else:
+        return []
+    return [[ring_coords(ring, coords, offsets) for ring in poly] for poly in polys]
+
+def ring_area_centroid(ring):
+    """Signed planar area and centroid of a closed lon/lat ring (shoelace formula)."""
+    x, y = ring[:, 0], ring[:, 1]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cross = x*y1 - x1*y
+    area = cross.sum() / 2.0
+    if abs(area) < 1e-12:
+        return 0.0, ring.mean(axis=0)
+    cx = ((x + x1)*cross).sum() / (6.0*area)
+    cy = ((y + y1)*cross).sum() / (6.0*area)
+    return area, np.array([cx, cy])
+
+def polygons_area_centroid(polygons):
+    """Area-weighted centroid over all polygons, holes subtracted."""
+    total = 0.0
+    moment = np.zeros(2)
+    for rings in polygons:
+        if not len(rings) or not len(rings[0]):
+            continue
+        ext_area, _ = ring_area_centroid(rings[0])
+        sign = 1.0 if ext_area >= 0 else -1.0
+        for ring in rings:
+            area, centroid = ring_area_centroid(ring)
+            # Holes wind opposite to their exterior, so the same sign flip makes them negative
+            total += sign*area
+            moment += sign*area*centroid
+    if total <= 0:
+        pts = np.concatenate([r for rings in polygons for r in rings])
+        return 0.0, pts.mean(axis=0)
+    return total, moment / total
+
+def build_index(topo, name_property='NAME'):
+    """Bounding box of the whole map plus per-country bounds, area and centroid."""
+    coords, offsets = decode_arcs(topo)
+    # A declared bbox wins over the bounds of the decoded arcs
+    if len(topo.get('bbox') or ()) == 4:
+        bbox = [float(v) for v in topo['bbox']]
+    elif len(coords):
+        minx, miny = coords.min(axis=0); maxx, maxy = coords.max(axis=0)
+        bbox = [float(minx), float(miny), float(maxx), float(maxy)]
+    else:
+        bbox = list(WORLD_BBOX)
+    countries = {}
+    for obj in topo.get('objects', {}).values():
+        for geom in obj.get('geometries', []):
+            name = (geom.get('properties') or {}).get(name_property)
+            polygons = geometry_polygons(geom, coords, offsets)
+            if not name or not polygons:
+                continue
+            pts = np.concatenate([r for rings in polygons for r in rings])
+            area, centroid = polygons_area_centroid(polygons)
+            countries[name] = {
+                'bbox': [round(float(v), 4) for v in (*pts.min(axis=0), *pts.max(axis=0))],
+                'centroid': [round(float(v), 4) for v in centroid],
+                'area': round(float(area), 4),
+            }
+    return {'version': INDEX_VERSION, 'bbox': bbox, 'countries': countries}
+
+def points_in_rings(points, rings):
+    """Even-odd point-in-polygon test of (K, 2) points against a polygon's rings (holes included)."""
+    inside = np.zeros(len(points), dtype=bool)
+    x, y = points[:, 0][:, None], points[:, 1][:, None]
+    for ring in rings:
+        x0, y0 = ring[:, 0], ring[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        straddles = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross_x = x0 + (y - y0)*(x1 - x0)/(y1 - y0)
+        inside ^= (straddles & (x < cross_x)).sum(axis=1) % 2 == 1
+    return inside
+
+def _quantize_ring(ring, scale):
+    q = np.rint(ring*scale).astype(np.int64)
+    # First position absolute, the rest deltas from the previous one
+    return np.diff(q, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel().tolist()
+
+def build_hit_grid(topo, cell_size=3.0, precision=1, name_property='NAME'):
+    """Uniform lon/lat grid of candidate polygons for hover hit-testing.
+
+    Each non-empty cell lists the polygons that may cover it; ~i marks a cell
+    lying wholly inside polygon i, where no point-in-polygon test is needed.
+    'cells' is flat: [cell index delta, count, polygon, ...] per non-empty cell
+    in row-major order. Polygon rings are quantized to `precision` decimals and
+    delta-encoded.
+    """
+    coords, offsets = decode_arcs(topo)
+    x0, y0 = WORLD_BBOX[0], WORLD_BBOX[1]
+    cols = int(np.ceil((WORLD_BBOX[2] - x0)/cell_size))
+    rows = int(np.ceil((WORLD_BBOX[3] - y0)/cell_size))
+    names, polygons, cells = [], [], {}
+    scale = 10**precision
+    for obj in topo.get('objects', {}).values():
+        for geom in obj.get('geometries', []):
+            name = (geom.get('properties') or {}).get(name_property)
+            if not name:
+                continue
+            for rings in geometry_polygons(geom, coords, offsets):
+                rings = [r for r in rings if len(r) >= 3]
+                if not rings:
+                    continue
+                poly = len(polygons)
+                if not names or names[-1] != name:
+                    names.append(name)
+                polygons.append({'country': len(names) - 1, 'rings': [_quantize_ring(r, scale) for r in rings]})
+
+                # Boundary cells: every cell under the bounding box of an edge
+                pts = np.concatenate([np.vstack([r, r[:1]]) for r in rings])
+                breaks = np.cumsum([len(r) + 1 for r in rings])[:-1] - 1
+                seg0, seg1 = pts[:-1], pts[1:]
+                keep = np.ones(len(seg0), dtype=bool); keep[breaks] = False
+                lo = np.floor((np.minimum(seg0, seg1)[keep] - (x0, y0))/cell_size).astype(int)
+                hi = np.floor((np.maximum(seg0, seg1)[keep] - (x0, y0))/cell_size).astype(int)
+                lo = np.clip(lo, 0, (cols - 1, rows - 1)); hi = np.clip(hi, 0, (cols - 1, rows - 1))
+                boundary = set()
+                for (c0, r0), (c1, r1) in zip(lo.tolist(), hi.tolist()):
+                    boundary.update(r*cols + c for r in range(r0, r1 + 1) for c in range(c0, c1 + 1))
+
+                # Interior cells: inside the polygon's bounds, crossed by no edge, centre inside
+                (cmin, rmin), (cmax, rmax) = lo.min(axis=0), hi.max(axis=0)
+                cc, rr = np.meshgrid(np.arange(cmin, cmax + 1), np.arange(rmin, rmax + 1))
+                centres = np.stack([x0 + (cc.ravel() + 0.5)*cell_size, y0 + (rr.ravel() + 0.5)*cell_size], axis=1)
+                ids = (rr*cols + cc).ravel()
+                interior = [int(i) for i in ids[points_in_rings(centres, rings)] if i not in boundary]
+
+                for i in boundary:
+                    cells.setdefault(i, []).append(poly)
+                for i in interior:
+                    cells.setdefault(i, []).append(~poly)
+    return {
+        'version': HIT_GRID_VERSION,
+        'bbox': list(WORLD_BBOX),
+        'cellSize': cell_size,
+        'cols': cols,
+        'rows': rows,
+        'scale': scale,
+        'names': names,
+        'polygons': polygons,
+        'cells': _flatten_cells(cells),
+    }
+
+def _flatten_cells(cells):
+    flat, previous = [], 0
+    for i in sorted(cells):
+        flat += [i - previous, len(cells[i]), *cells[i]]
+        previous = i
+    return flat
+
+def hit_test_grid(grid, lon, lat):
+    """Name of the country under (lon, lat) from a build_hit_grid() index, or None."""
+    x0, y0 = grid['bbox'][:2]
+    col = int((lon - x0) // grid['cellSize']); row = int((lat - y0) // grid['cellSize'])
+    if not (0 <= col < grid['cols'] and 0 <= row < grid['rows']):
+        return None
+    target, cell, flat, i = row*grid['cols'] + col, 0, grid['cells'], 0
+    while i < len(flat):
+        cell += flat[i]; count = flat[i + 1]
+        if cell == target:
+            for poly in flat[i + 2:i + 2 + count]:
+                if poly < 0:
+                    return grid['names'][grid['polygons'][~poly]['country']]
+                polygon = grid['polygons'][poly]
+                rings = [np.cumsum(np.reshape(r, (-1, 2)), axis=0) / grid['scale'] for r in polygon['rings']]
+                if points_in_rings(np.array([[lon, lat]]), rings)[0]:
+                    return grid['names'][polygon['country']]
+            return None
+        i += 2 + count
+    return None
+
+def load_topo_index(path, cache_dir=DEFAULT_INDEX_DIR):
+    """build_index() for a TopoJSON file, cached on disk under the file's content hash."""
+    digest = file_sha256(path)
+    cache_path = os.path.join(cache_dir, f'topo_index_{digest[:16]}.json') if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION and index.get('sha256') == digest:
+            return index
+    index = build_index(load_topology(path))
+    index['sha256'] = digest
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+    return index
+
+def country_coords_from_index(index, name_mapping=MAP_NAME_MAPPING):
+    """COUNTRY_COORDS-style {name: {'lat', 'lon'}} table built from map centroids."""
+    coords = {}
+    for name, info in index['countries'].items():
+        lon, lat = info['centroid']
+        coords[name_mapping.get(name, name)] = {'lat': lat, 'lon': lon}
+    return coords
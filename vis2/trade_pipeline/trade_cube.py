@@ -0,0 +1,203 @@
+"""Dense country x half-year period x direction cube of the ABS trade tables.
+
+The six-month tables are ingested once into a float64 array of values in $M,
+NaN where a value is suppressed, blank or zero. Countries are sorted by name
+and periods ('2018-H2') chronologically, with label -> position maps for each
+axis, so slices, year rollups, top-k and threshold filters are plain NumPy
+operations on the array. The array is saved as .npy (loaded memory-mapped)
+with a JSON sidecar holding the axis labels, so a new cutoff or year range
+is a query rather than a re-ingest.
+"""
+import json
+import os
+
+import numpy as np
+
+from .excel_ingest import DEFAULT_SHEET_CACHE_DIR
+from .json_writer import write_json
+from .pipeline_metrics import count
+
+CUBE_PATH = 'build/trade_cube.npy'
+CUBE_VERSION = 1
+DIRECTIONS = ('exports', 'imports')
+UNIT = '$M'
+
+def period_label(year, half):
+    return f'{year}-H{half}'
+
+def period_year(label):
+    return int(label[:4])
+
+def cube_sidecar(path=CUBE_PATH):
+    """Path of the JSON sidecar holding a cube's axes"""
+    return os.path.splitext(path)[0] + '.json'
+
+class TradeCube:
+    """values[country, period, direction] in $M, NaN where nothing was published."""
+
+    def __init__(self, values, countries, periods, directions=DIRECTIONS):
+        self.values = values
+        self.countries = list(countries)
+        self.periods = list(periods)
+        self.directions = list(directions)
+        self.country_index = {c: i for i, c in enumerate(self.countries)}
+        self.period_index = {p: i for i, p in enumerate(self.periods)}
+        self.direction_index = {d: i for i, d in enumerate(self.directions)}
+        # Periods are chronological, so each year is a contiguous run of them
+        self.period_years = np.array([period_year(p) for p in self.periods], dtype=np.int64)
+        self.years = sorted(set(self.period_years.tolist()))
+        self._year_starts = np.flatnonzero(np.diff(self.period_years, prepend=-1))
+        self._yearly = None
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def _positions(self, labels, index):
+        if labels is None:
+            return slice(None)
+        if isinstance(labels, slice):
+            return labels
+        if isinstance(labels, str):
+            return index[labels]
+        return [index[label] for label in labels]
+
+    def period_range(self, first_year=None, last_year=None):
+        """slice of the periods in first_year..last_year (inclusive; None leaves that end open)"""
+        lo = 0 if first_year is None else int(np.searchsorted(self.period_years, first_year, 'left'))
+        hi = len(self.periods) if last_year is None else int(np.searchsorted(self.period_years, last_year, 'right'))
+        return slice(lo, hi)
+
+    def year_range(self, first_year=None, last_year=None):
+        """slice of the rollup() years in first_year..last_year"""
+        years = np.array(self.years)
+        lo = 0 if first_year is None else int(np.searchsorted(years, first_year, 'left'))
+        hi = len(years) if last_year is None else int(np.searchsorted(years, last_year, 'right'))
+        return slice(lo, hi)
+
+    def select(self, countries=None, periods=None, directions=None):
+        """Sub-array for a label or list of labels per axis; None keeps the whole axis.
+
+        A single label drops its axis, as integer indexing does; a slice (e.g.
+        from period_range) is used as is.
+        """
+        keys = [self._positions(countries, self.country_index), self._positions(periods, self.period_index),
+                self._positions(directions, self.direction_index)]
+        out = self.values
+        # Last axis first, so a dropped axis never shifts the ones still to index
+        for axis in reversed(range(3)):
+            key = keys[axis]
+            out = np.take(out, key, axis=axis) if isinstance(key, list) else out[(slice(None),)*axis + (key,)]
+        return out
+
+    def value(self, country, period, direction):
+        return float(self.values[self.country_index[country], self.period_index[period],
+                                 self.direction_index[direction]])
+
+    def rollup(self):
+        """(countries, years, directions) calendar-year sums of the half years, NaN where neither was published"""
+        if self._yearly is None:
+            published = ~np.isnan(self.values)
+            sums = np.add.reduceat(np.where(published, self.values, 0.0), self._year_starts, axis=1)
+            any_published = np.logical_or.reduceat(published, self._year_starts, axis=1)
+            self._yearly = np.where(any_published, sums, np.nan)
+        return self._yearly
+
+    def _series(self, direction, yearly):
+        """(time, country) values of one direction, by year or by period"""
+        return (self.rollup() if yearly else self.values)[:, :, self.direction_index[direction]].T
+
+    def top_k(self, direction, k=10, yearly=False):
+        """(country positions, values) of the k largest values of each period (or year), largest first.
+
+        Both are (time, k) arrays; a time with fewer than k published values
+        is padded with NaN values (ties keep country order).
+        """
+        series = self._series(direction, yearly)
+        order = np.argsort(-np.where(np.isnan(series), -np.inf, series), axis=1, kind='stable')[:, :k]
+        return order, np.take_along_axis(series, order, axis=1)
+
+    def threshold(self, direction, min_value_m, first_year=None, last_year=None, yearly=True):
+        """(country positions, time positions) of the values >= min_value_m $M, by time then country"""
+        series = self._series(direction, yearly)
+        span = self.year_range(first_year, last_year) if yearly else self.period_range(first_year, last_year)
+        mask = np.zeros(series.shape, dtype=bool)
+        # NaN compares False, so unpublished values never pass
+        mask[span] = series[span] >= min_value_m
+        t, c = np.nonzero(mask)
+        return c, t
+
+    def records(self, direction, min_value_b=5, min_year=2019, max_year=None):
+        """{'country', 'year', 'value'} records of the yearly values of at least min_value_b $B, by year then country.
+
+        Values are rounded to $0.01B before the comparison, as aggregate_trade does.
+        """
+        series = self._series(direction, yearly=True)
+        span = self.year_range(min_year, max_year)
+        mask = np.zeros(series.shape, dtype=bool)
+        # A vectorized cut a cent below min_value_b, then the exact one on the few candidates:
+        # np.round rounds some half cents (e.g. 9.135) the other way from round()
+        mask[span] = series[span] >= (min_value_b - 0.01) * 1000
+        records = []
+        for j, i in zip(*(a.tolist() for a in np.nonzero(mask))):
+            value = round(float(series[j, i]) / 1000, 2)
+            if value >= min_value_b:
+                records.append({'country': self.countries[i], 'year': self.years[j], 'value': value})
+        count('records_kept', len(records))
+        count('records_filtered', int((~np.isnan(series)).sum()) - len(records))
+        return records
+
+    def save(self, path=CUBE_PATH):
+        """Write the values as .npy and the axes as its JSON sidecar, each replaced atomically"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        # A file object, since np.save appends .npy to any other file name
+        with open(tmp, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.values, dtype=np.float64))
+        os.replace(tmp, path)
+        write_json({
+            'version': CUBE_VERSION,
+            'unit': UNIT,
+            'dtype': 'float64',
+            'shape': list(self.shape),
+            'axes': {'country': self.countries, 'period': self.periods, 'direction': self.directions},
+        }, cube_sidecar(path))
+
+def load_cube(path=CUBE_PATH, mmap=True):
+    """TradeCube saved at path, its values memory-mapped read-only unless mmap is False"""
+    with open(cube_sidecar(path), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != CUBE_VERSION:
+        raise ValueError(f'{path}: cube version {meta.get("version")}, expected {CUBE_VERSION}; rebuild it')
+    values = np.load(path, mmap_mode='r' if mmap else None)
+    if list(values.shape) != meta['shape']:
+        raise ValueError(f'{path}: shape {values.shape} does not match its sidecar {meta["shape"]}')
+    axes = meta['axes']
+    return TradeCube(values, axes['country'], axes['period'], axes['direction'])
+
+def cube_from_tables(tables):
+    """TradeCube of {direction: DataFrame of country, year, half and value} (see half_year_table)"""
+    directions = list(tables)
+    countries = sorted(set().union(*(set(t['country']) for t in tables.values())))
+    periods = sorted({period_label(y, h) for t in tables.values() for y, h in zip(t['year'], t['half'])})
+    cube = TradeCube(np.full((len(countries), len(periods), len(directions)), np.nan), countries, periods, directions)
+    for d, table in enumerate(tables.values()):
+        # Rows that normalize to the same country are summed, as ingest_csv does
+        cells = table.groupby(['country', 'year', 'half'], sort=False)['value'].sum()
+        c = [cube.country_index[country] for country, _, _ in cells.index]
+        p = [cube.period_index[period_label(y, h)] for _, y, h in cells.index]
+        cube.values[c, p, d] = cells.to_numpy(dtype=np.float64)
+    return cube
+
+def half_year_table(table):
+    """ingest_periods() table with the half of the year of each row; raises ValueError unless every period is six months"""
+    from .convert_csv_to_json import parse_period_halves
+    periods = table['period'].drop_duplicates()
+    halves = dict(zip(periods, parse_period_halves(periods)))
+    return table.assign(half=table['period'].map(halves))
+
+def build_cube(sources, cache_dir=DEFAULT_SHEET_CACHE_DIR):
+    """TradeCube of the ABS six-month tables in sources, {direction: path}"""
+    from .convert_csv_to_json import ingest_periods
+    return cube_from_tables({direction: half_year_table(ingest_periods(path, direction, cache_dir))
+                             for direction, path in sources.items()})